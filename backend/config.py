@@ -22,6 +22,11 @@ class Settings(BaseSettings):
     # Logging setting
     DATE_FMT: str = "%Y-%m-%d %H:%M:%S"
     LOG_DIR: str = f"{basedir}/logs/api.log"
+    LOG_TIMEZONE: str = "Asia/Ho_Chi_Minh"
+    LOG_JSON: bool = False  # one JSON object per line
+    LOG_QUEUE_SIZE: int = 10000  # records beyond are dropped, never blocking
+    # Fraction of INFO records kept per module file name, e.g. {"batcher": 0.1}
+    LOG_SAMPLE_RATES: dict[str, float] = {}
 
     # Database config
     DATABASE_URL: PostgresDsn
@@ -1,10 +1,145 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import time
 from datetime import datetime
 
 import pytz
 from config import settings
 
 
+class TimezoneFormatter(logging.Formatter):
+    """
+    Formats record times in the configured timezone.
+
+    The UTC offset is looked up once per hour of log time instead of converting
+    every record with pytz.
+    """
+
+    def __init__(self, fmt=None, datefmt=None, timezone=settings.LOG_TIMEZONE):
+        super().__init__(fmt, datefmt=datefmt)
+        self.timezone = pytz.timezone(timezone)
+        self.offset_hour = None
+        self.offset = 0.0
+
+    def converter(self, timestamp):
+        hour = int(timestamp // 3600)
+        if hour != self.offset_hour:
+            self.offset = (
+                datetime.fromtimestamp(timestamp, self.timezone)
+                .utcoffset()
+                .total_seconds()
+            )
+            self.offset_hour = hour
+
+        return time.gmtime(timestamp + self.offset)
+
+
+class JsonFormatter(TimezoneFormatter):
+    """
+    Formats records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the INFO and DEBUG records of high-volume modules.
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+
+        sample_rate = self.sample_rates.get(record.module)
+
+        return sample_rate is None or random.random() < sample_rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them, and drops them
+    instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue stays in-process, so formatting is left to the listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        """
+        Returns the queue counters.
+
+        Returns:
+        - dict: Queue depth and capacity, and number of dropped records.
+        """
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.dropped,
+        }
+
+
+class DropReportingQueueListener(logging.handlers.QueueListener):
+    """
+    Writes the queued records and, from the listener thread, warns whenever the
+    queue handler has dropped records since the last warning.
+    """
+
+    def __init__(self, queue_handler, *handlers):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.reported = 0
+
+    def handle(self, record):
+        super().handle(record)
+
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported:
+            super().handle(
+                logging.makeLogRecord(
+                    {
+                        "name": record.name,
+                        "levelno": logging.WARNING,
+                        "levelname": logging.getLevelName(logging.WARNING),
+                        "msg": f"Dropped {dropped - self.reported} log records, "
+                        f"the log queue is full ({dropped} in total).",
+                    }
+                )
+            )
+            self.reported = dropped
+
+
 def initial_logger():
     # Create a logger instance
     logger = logging.getLogger("app")
@@ -12,39 +147,59 @@ def initial_logger():
     # Set the logging level
     logger.setLevel(logging.DEBUG)
 
-    # Set the timezone to Vietnam
-    vietnam_timezone = pytz.timezone("Asia/Ho_Chi_Minh")
-
-    # Configure logging with the Vietnam timezone
-    logging.Formatter.converter = (
-        lambda *args: pytz.utc.localize(datetime.utcnow())
-        .astimezone(vietnam_timezone)
-        .timetuple()
-    )
-
     # Define the log format
     console_log_format = "%(asctime)s - %(levelname)s - %(message)s"
     file_log_format = (
         "%(asctime)s - %(levelname)s - %(message)s - (%(filename)s:%(lineno)d)"
     )
 
+    # Format times in the Vietnam timezone, optionally as JSON
+    if settings.LOG_JSON:
+        console_formatter = file_formatter = JsonFormatter(datefmt=settings.DATE_FMT)
+    else:
+        console_formatter = TimezoneFormatter(
+            console_log_format, datefmt=settings.DATE_FMT
+        )
+        file_formatter = TimezoneFormatter(file_log_format, datefmt=settings.DATE_FMT)
+
     # Create a console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
-    console_handler.setFormatter(
-        logging.Formatter(console_log_format, datefmt=settings.DATE_FMT)
-    )
-    logger.addHandler(console_handler)
+    console_handler.setFormatter(console_formatter)
 
     # Create a file handler
     file_handler = logging.FileHandler(filename=settings.LOG_DIR, encoding="utf-8")
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(
-        logging.Formatter(file_log_format, datefmt=settings.DATE_FMT)
-    )
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(file_formatter)
+
+    # The request path only enqueues records, a listener thread formats and
+    # writes them
+    queue_handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    if settings.LOG_SAMPLE_RATES:
+        queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    logger.addHandler(queue_handler)
+
+    listener = DropReportingQueueListener(queue_handler, console_handler, file_handler)
+    listener.start()
+
+    # Flush the queued records on exit
+    atexit.register(listener.stop)
 
     return logger
 
 
+def logging_stats():
+    """
+    Returns the counters of the log queue, e.g. to notice dropped records.
+
+    Returns:
+    - dict: Queue depth and capacity, and number of dropped records.
+    """
+    for handler in LOGGER.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler.stats()
+
+    return {}
+
+
 LOGGER = initial_logger()
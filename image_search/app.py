@@ -1,20 +1,87 @@
+import asyncio
+import io
+import secrets
 import time
+from functools import partial
+from typing import Literal
 
+import numpy as np
 from config import settings
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    File,
+    Header,
+    HTTPException,
+    Request,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from qdrant_client.http.exceptions import UnexpectedResponse
+from src.execution.pools import ExecutionPools
+from src.faiss_search.ingest_data import update_index_file
 from src.faiss_search.searcher import FaissSearch
+from src.feature_extraction.batcher import MicroBatcher
+from src.feature_extraction.cache import EmbeddingCache
 from src.feature_extraction.extractor import FeatureExtractor
+from src.feature_extraction.preprocessing import BufferPool
 from src.qdrant_search.searcher import QdrantSearch
-from src.schemas import ImageBase64Request, Product
-from src.utils import LOGGER, save_image_file
+from src.schemas import ImageBase64Request, Product, SearchFilters
+from src.utils import (
+    LOGGER,
+    ImageTooLargeError,
+    InvalidImageError,
+    logging_stats,
+    read_image_file,
+    read_request_image,
+    unpack_msgpack_image,
+)
 
 # Initialize the feature extractor and FaissSearch instances
 feature_extractor = FeatureExtractor()
 faiss_search = FaissSearch()
 qdrant_search = QdrantSearch()
 
+# Run preprocessing, model inference and Faiss search off the event loop
+pools = ExecutionPools()
+
+# Coalesce concurrent requests into batched forward passes, one batcher per backend
+local_batcher = MicroBatcher(
+    name="local",
+    infer_fn=partial(pools.inference.run, feature_extractor.extract_batch),
+    # Batches beyond the inference workers would only wait in the pool queue
+    max_in_flight=settings.INFERENCE_WORKERS,
+)
+triton_batchers = {
+    model_name: MicroBatcher(
+        name=model_name,
+        infer_fn=partial(
+            feature_extractor.triton_inference,
+            model_name=model_name,
+            inputs_name=settings.MODEL_INPUT_NAME,
+            outputs_name=settings.MODEL_OUTPUT_NAME,
+        ),
+    )
+    for model_name in (settings.TENSORRT_MODEL_NAME, settings.PYTORCH_MODEL_NAME)
+}
+
+# Batch tensors of /search-image-batch, reused across requests
+batch_buffers = BufferPool(
+    settings.SEARCH_BATCH_MAX_IMAGES, num_buffers=settings.INFERENCE_WORKERS
+)
+
+# Skip extraction for images that were uploaded before
+embedding_cache = EmbeddingCache() if settings.CACHE_ENABLED else None
+
+# Content types accepted by /search-image-binary
+OCTET_STREAM = "application/octet-stream"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Serialize updates of the Faiss index file
+faiss_update_lock = asyncio.Lock()
+
 # Create a FastAPI app instance with the specified title from settings
 app = FastAPI(title=settings.APP_NAME)
 
@@ -28,43 +95,253 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(ImageTooLargeError)
+async def image_too_large_handler(request: Request, exc: ImageTooLargeError):
+    """Answer uploads over the byte or pixel limits with 413."""
+    LOGGER.warning("Rejected upload: %s", exc)
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(InvalidImageError)
+async def invalid_image_handler(request: Request, exc: InvalidImageError):
+    """Answer uploads that are not a supported image with 400."""
+    LOGGER.warning("Rejected upload: %s", exc)
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
 @app.get("/healthz")
 def healthcheck() -> bool:
     """Check the server's status."""
     return True
 
 
+@app.get("/stats/batching")
+def batching_stats() -> list[dict]:
+    """Report how full the micro-batches of each inference backend are."""
+    return [local_batcher.stats()] + [
+        batcher.stats() for batcher in triton_batchers.values()
+    ]
+
+
+@app.get("/stats/executors")
+def executors_stats() -> list[dict]:
+    """Report the size and queue depth of each execution pool."""
+    return pools.stats()
+
+
+@app.get("/stats/cache")
+def cache_stats() -> dict:
+    """Report the hit and miss counters of the query embedding cache."""
+    return embedding_cache.stats() if embedding_cache is not None else {}
+
+
+@app.get("/stats/logging")
+def log_stats() -> dict:
+    """Report the depth of the log queue and the records dropped when it was full."""
+    return logging_stats()
+
+
+@app.get("/stats/triton")
+def triton_stats() -> list[dict]:
+    """Report the health, load and latency of each Triton gRPC channel."""
+    return feature_extractor.triton_pool.stats()
+
+
+@app.get("/faiss/version")
+def faiss_version() -> dict:
+    """Report the version of the Faiss index currently searched."""
+    return faiss_search.snapshot.info()
+
+
+async def watch_faiss_index():
+    """Reload the Faiss index whenever its file or the dataset file changes."""
+    while True:
+        await asyncio.sleep(settings.INDEX_WATCH_INTERVAL)
+        await asyncio.to_thread(faiss_search.reload_if_changed)
+
+
+@app.on_event("startup")
+async def startup():
+    """Start watching the Faiss index files."""
+    if settings.INDEX_WATCH_INTERVAL > 0:
+        app.state.index_watcher = asyncio.create_task(watch_faiss_index())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the batching tasks, the pools, the Triton shared memory and the cache."""
+    if getattr(app.state, "index_watcher", None) is not None:
+        app.state.index_watcher.cancel()
+    await local_batcher.close()
+    for batcher in triton_batchers.values():
+        await batcher.close()
+    pools.shutdown()
+    await feature_extractor.close()
+    if embedding_cache is not None:
+        await embedding_cache.close()
+
+
+def verify_admin_token(x_admin_token: str = Header(default="")):
+    """Reject admin requests without the configured admin token."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled.")
+    if not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+
+def apply_faiss_delta(contents):
+    """
+    Applies a delta npz file to the saved Faiss index and reloads the index.
+
+    Args:
+        contents (bytes): The raw contents of the delta file.
+
+    Returns:
+        dict: Number of upserted and deleted products.
+    """
+    with np.load(io.BytesIO(contents)) as delta:
+        counts = update_index_file(delta, reducer=faiss_search.reducer)
+
+    counts["version"] = faiss_search.load().version
+
+    return counts
+
+
+@app.post("/admin/faiss/reload", dependencies=[Depends(verify_admin_token)])
+async def reload_faiss_index() -> dict:
+    """
+    Loads the Faiss index and dataset from disk in the background and swaps them
+    in. Searches keep using the previous version until the new one is ready.
+    """
+    try:
+        snapshot = await asyncio.to_thread(faiss_search.load)
+    except Exception as e:
+        LOGGER.error("Could not reload Faiss index: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return snapshot.info()
+
+
+@app.post("/admin/faiss/delta", dependencies=[Depends(verify_admin_token)])
+async def update_faiss_index(file: UploadFile = File(...)) -> dict:
+    """
+    Upserts and deletes products of the Faiss index from an uploaded npz file with
+    arrays upsert_ids, upsert_features and delete_ids.
+    """
+    contents = await file.read()
+
+    try:
+        # Off the search pool, so an update does not take a search worker
+        async with faiss_update_lock:
+            return await asyncio.to_thread(apply_faiss_delta, contents)
+
+    except ValueError as e:
+        LOGGER.error("Could not update Faiss index: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def cache_namespace(batcher):
+    """
+    Names the backend and model producing the features of a batcher, so that
+    cached features of another backend or model are never returned.
+
+    Args:
+        batcher (MicroBatcher): The batcher of the inference backend, or None for
+            the Triton preprocessing ensemble.
+
+    Returns:
+        str: The cache key namespace.
+    """
+    if batcher is None:
+        return f"triton:{settings.ENSEMBLE_MODEL_NAME}"
+
+    if batcher is local_batcher:
+        return f"local:{feature_extractor.model_id}"
+
+    return f"triton:{batcher.name}"
+
+
+async def extract_upload_feature(contents, batcher):
+    """
+    Extracts the features of an uploaded image, skipping decoding, preprocessing
+    and inference when the same image is in the embedding cache.
+
+    Args:
+        contents (bytes): The raw contents of the uploaded image.
+        batcher (MicroBatcher): The batcher of the inference backend, or None to
+            send the compressed image to the Triton preprocessing ensemble.
+
+    Returns:
+        numpy.ndarray: The extracted features. (1, DIMENSIONS)
+    """
+
+    async def extract():
+        if batcher is None:
+            # Triton decodes and preprocesses the image itself
+            return await feature_extractor.triton_extract_bytes(contents)
+
+        image = await pools.preprocess.run(feature_extractor.preprocess_bytes, contents)
+        return await batcher.submit(image)
+
+    if embedding_cache is None:
+        return await extract()
+
+    key = embedding_cache.key(contents, namespace=cache_namespace(batcher))
+    feature = await embedding_cache.get(key)
+
+    if feature is None:
+        feature = await extract()
+        await embedding_cache.set(key, feature)
+
+    return feature
+
+
 @app.post("/search-image-faiss", response_model=list[Product])
-async def search_image_faiss(file: UploadFile = File(...)):
+async def search_image_faiss(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    filters: SearchFilters = Depends(),
+):
     start_time = time.time()
     try:
-        image_path = await save_image_file(file=file)
+        contents = await read_image_file(file=file, background_tasks=background_tasks)
 
         # Extract features from the uploaded image using the feature extractor
-        feature = feature_extractor.extract_feature(image_path=image_path)
+        feature = await extract_upload_feature(contents, local_batcher)
 
         # Perform a search using the extracted feature vector
-        search_results = faiss_search.search(query_vector=feature, top_k=20)
+        search_results = await pools.search.run(
+            faiss_search.search, query_vector=feature, top_k=20, filters=filters
+        )
 
         LOGGER.info(f"Faiss search executed in {time.time() - start_time:.4f} seconds.")
         return search_results
 
+    except (ImageTooLargeError, InvalidImageError):
+        raise
+
     except Exception as e:
         LOGGER.error("Could not perform search: %s", e)
         raise HTTPException(status_code=500, detail=e)
 
 
 @app.post("/search-image-qdrant", response_model=list[Product])
-async def search_image_qdrant(file: UploadFile = File(...)):
+async def search_image_qdrant(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    filters: SearchFilters = Depends(),
+):
     start_time = time.time()
     try:
-        image_path = await save_image_file(file=file)
+        contents = await read_image_file(file=file, background_tasks=background_tasks)
 
         # Extract features from the uploaded image using the feature extractor
-        feature = feature_extractor.extract_feature(image_path=image_path)
+        feature = await extract_upload_feature(contents, local_batcher)
 
         # Perform a search using the extracted feature vector
-        search_results = await qdrant_search.search(query_vector=feature, top_k=20)
+        search_results = await qdrant_search.search(
+            query_vector=feature, top_k=20, filters=filters
+        )
 
         result = [Product.from_point(point) for point in search_results.result]
 
@@ -80,26 +357,154 @@ async def search_image_qdrant(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=e.reason_phrase)
 
 
+async def extract_upload_features(contents):
+    """
+    Extracts the features of many uploaded images with one batched model call,
+    reusing cached features where possible.
+
+    Args:
+        contents (list[bytes]): The raw contents of the uploaded images.
+
+    Returns:
+        numpy.ndarray: The extracted features, in input order. (N, DIMENSIONS)
+    """
+    features = [None] * len(contents)
+    keys = [None] * len(contents)
+
+    if embedding_cache is not None:
+        for i, content in enumerate(contents):
+            keys[i] = embedding_cache.key(
+                content, namespace=cache_namespace(local_batcher)
+            )
+            features[i] = await embedding_cache.get(keys[i])
+
+    missing = [i for i, feature in enumerate(features) if feature is None]
+    if missing:
+        # Preprocess the images in parallel straight into one pooled batch
+        # tensor, then extract features in one batch
+        with batch_buffers.batch(len(missing)) as images:
+            await asyncio.gather(
+                *[
+                    pools.preprocess.run(
+                        feature_extractor.preprocess_bytes, contents[i], out=images[row]
+                    )
+                    for row, i in enumerate(missing)
+                ]
+            )
+            extracted = await pools.inference.run(
+                feature_extractor.extract_batch, images
+            )
+
+        for row, i in enumerate(missing):
+            features[i] = extracted[row : row + 1]
+            if embedding_cache is not None:
+                await embedding_cache.set(keys[i], features[i])
+
+    return np.concatenate(features)
+
+
+@app.post("/search-image-batch", response_model=list[list[Product]])
+async def search_image_batch(
+    background_tasks: BackgroundTasks,
+    files: list[UploadFile] = File(...),
+    backend: Literal["faiss", "qdrant"] = "faiss",
+    top_k: int = 20,
+    filters: SearchFilters = Depends(),
+):
+    """
+    Endpoint to upload many images and search for each of them in one request.
+
+    Args:
+        background_tasks (BackgroundTasks): Tasks run after the response is sent.
+        files (list[UploadFile]): The image files to be uploaded.
+        backend (str): The vector search backend, "faiss" or "qdrant".
+        top_k (int): The number of results per image.
+        filters (SearchFilters): Payload filters applied during search.
+
+    Returns:
+        list: One list of search results per image, in input order.
+    """
+    if len(files) > settings.SEARCH_BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.SEARCH_BATCH_MAX_IMAGES} images per request.",
+        )
+
+    start_time = time.time()
+    try:
+        contents = [
+            await read_image_file(file=file, background_tasks=background_tasks)
+            for file in files
+        ]
+
+        features = await extract_upload_features(contents)
+
+        # Perform one search with the matrix of query vectors
+        if backend == "faiss":
+            result = await pools.search.run(
+                faiss_search.search_batch,
+                query_vectors=features,
+                top_k=top_k,
+                filters=filters,
+            )
+        else:
+            search_results = await qdrant_search.search_batch(
+                query_vectors=features, top_k=top_k, filters=filters
+            )
+            result = [
+                [Product.from_point(point) for point in batch_result.result]
+                for batch_result in search_results.result
+            ]
+
+        LOGGER.info(
+            f"Batch {backend} search of {len(files)} images executed in "
+            f"{time.time() - start_time:.4f} seconds."
+        )
+        return result
+
+    except UnexpectedResponse as e:
+        LOGGER.error("Could not perform search: %s", e)
+        raise HTTPException(status_code=500, detail=e.reason_phrase)
+
+    except (ImageTooLargeError, InvalidImageError):
+        raise
+
+    except Exception as e:
+        LOGGER.error("Could not perform search: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/search-image", response_model=list[Product])
-async def search_image_qdrant_triton(file: UploadFile = File(...)):
+async def search_image_qdrant_triton(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    filters: SearchFilters = Depends(),
+):
     """
     Endpoint to upload an image, extract features, and perform a search.
 
     Args:
+        background_tasks (BackgroundTasks): Tasks run after the response is sent.
         file (UploadFile): The image file to be uploaded.
+        filters (SearchFilters): Payload filters applied during search.
 
     Returns:
         dict: A dictionary containing search results, including item information.
     """
-    image_path = await save_image_file(file=file)
+    contents = await read_image_file(file=file, background_tasks=background_tasks)
 
     # Extract features from the uploaded image using the feature extractor
-    feature = await feature_extractor.triton_extract_feature(
-        image_path=image_path, model_name=settings.TENSORRT_MODEL_NAME
+    feature = await extract_upload_feature(
+        contents,
+        None
+        if settings.TRITON_SERVER_PREPROCESS
+        else triton_batchers[settings.TENSORRT_MODEL_NAME],
     )
 
     # Perform a search using the extracted feature vector
-    search_results = await qdrant_search.search(query_vector=feature, top_k=20)
+    search_results = await qdrant_search.search(
+        query_vector=feature, top_k=20, filters=filters
+    )
 
     result = [Product.from_point(point) for point in search_results.result]
 
@@ -107,14 +512,65 @@ async def search_image_qdrant_triton(file: UploadFile = File(...)):
 
 
 @app.post("/search-image-base64", response_model=list[Product])
-async def search_image_base64(data: ImageBase64Request):
+async def search_image_base64(
+    data: ImageBase64Request, filters: SearchFilters = Depends()
+):
     # Extract features from the uploaded image using the feature extractor
-    feature = await feature_extractor.triton_extract_base64(
-        image=data.image, model_name=settings.PYTORCH_MODEL_NAME
+    image = await pools.preprocess.run(feature_extractor.preprocess_base64, data.image)
+    feature = await triton_batchers[settings.PYTORCH_MODEL_NAME].submit(image)
+
+    # Perform a search using the extracted feature vector
+    search_results = await qdrant_search.search(
+        query_vector=feature, top_k=20, filters=filters
+    )
+
+    result = [Product.from_point(point) for point in search_results.result]
+
+    return result
+
+
+@app.post("/search-image-binary", response_model=list[Product])
+async def search_image_binary(request: Request, filters: SearchFilters = Depends()):
+    """
+    Endpoint to search with an image sent as the request body, without the base64
+    and JSON overhead of /search-image-base64.
+
+    Args:
+        request (Request): The request, whose body is either the encoded image with
+            content type application/octet-stream, or a msgpack map
+            {"image": <bin>} with content type application/msgpack.
+        filters (SearchFilters): Payload filters applied during search.
+
+    Returns:
+        list: The search results.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != OCTET_STREAM and content_type not in MSGPACK_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content type must be {OCTET_STREAM} or {MSGPACK_TYPES[0]}.",
+        )
+
+    try:
+        contents = await read_request_image(request)
+        if content_type in MSGPACK_TYPES:
+            contents = unpack_msgpack_image(contents)
+
+    except (ImageTooLargeError, InvalidImageError):
+        raise
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Extract features from the uploaded image using the feature extractor
+    feature = await extract_upload_feature(
+        contents, triton_batchers[settings.PYTORCH_MODEL_NAME]
     )
 
     # Perform a search using the extracted feature vector
-    search_results = await qdrant_search.search(query_vector=feature, top_k=20)
+    search_results = await qdrant_search.search(
+        query_vector=feature, top_k=20, filters=filters
+    )
 
     result = [Product.from_point(point) for point in search_results.result]
 
@@ -122,12 +578,11 @@ async def search_image_base64(data: ImageBase64Request):
 
 
 @app.post("/search-image-test")
-async def test(file: UploadFile = File(...)):
-    image_path = await save_image_file(file=file)
+async def test(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    contents = await read_image_file(file=file, background_tasks=background_tasks)
 
     # Extract features from the uploaded image using the feature extractor
-    await feature_extractor.triton_extract_feature(
-        image_path=image_path, model_name=settings.TENSORRT_MODEL_NAME
-    )
+    image = await pools.preprocess.run(feature_extractor.preprocess_bytes, contents)
+    await triton_batchers[settings.TENSORRT_MODEL_NAME].submit(image)
 
     return "done"
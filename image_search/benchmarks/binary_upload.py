@@ -0,0 +1,137 @@
+"""
+Compare the request handling of the base64 JSON search body with the binary
+bodies (octet-stream and msgpack) of /search-image-binary.
+
+A minimal app runs the request parsing and decoding of each path, followed by the
+shared preprocessing, and stops before inference so only the request format
+differs. Bodies are encoded once up front and sent in-process. Run from the
+image_search directory:
+
+    python -m benchmarks.binary_upload --sizes 480x640 3000x4000
+"""
+
+import argparse
+import base64
+import io
+import json
+import time
+
+import msgpack
+import numpy as np
+import torch
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+from src.feature_extraction.preprocessing import Preprocessor
+from src.schemas import ImageBase64Request
+from src.utils import (
+    decode_image_bytes,
+    decode_img,
+    read_request_image,
+    unpack_msgpack_image,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark binary upload bodies")
+
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        help="upload sizes as HxW",
+        default=["480x640", "1080x1920", "3000x4000"],
+    )
+    parser.add_argument("--requests", type=int, help="requests per body", default=50)
+
+    return parser.parse_args()
+
+
+def synthetic_jpeg(height, width):
+    """
+    Encodes a smooth random image, closer to a photo than pure noise.
+    """
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BICUBIC)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+
+    return buffer.getvalue()
+
+
+def build_app():
+    """
+    Builds an app with the parsing and decoding of both request formats.
+    """
+    app = FastAPI()
+    preprocessor = Preprocessor()
+
+    @app.post("/base64")
+    def search_base64(data: ImageBase64Request):
+        image = preprocessor(decode_img(data.image))
+        return list(image.shape)
+
+    @app.post("/binary")
+    async def search_binary(request: Request):
+        contents = await read_request_image(request)
+        if request.headers["content-type"] != "application/octet-stream":
+            contents = unpack_msgpack_image(contents)
+        image = preprocessor(decode_image_bytes(contents))
+        return list(image.shape)
+
+    return app
+
+
+def throughput(client, path, body, content_type, num_requests):
+    """
+    Returns the requests per second of one body sent repeatedly.
+    """
+    headers = {"content-type": content_type}
+    response = client.post(path, content=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == [1, 3, 300, 300]
+
+    start_time = time.perf_counter()
+    for _ in range(num_requests):
+        client.post(path, content=body, headers=headers)
+
+    return num_requests / (time.perf_counter() - start_time)
+
+
+def main():
+    args = parse_args()
+
+    # Preprocessing runs on single-threaded pool workers in the service
+    torch.set_num_threads(1)
+
+    client = TestClient(build_app())
+
+    for size in args.sizes:
+        height, width = map(int, size.split("x"))
+        image = synthetic_jpeg(height, width)
+
+        bodies = {
+            "base64 json": (
+                "/base64",
+                json.dumps({"image": base64.urlsafe_b64encode(image).decode()}),
+                "application/json",
+            ),
+            "octet-stream": ("/binary", image, "application/octet-stream"),
+            "msgpack": (
+                "/binary",
+                msgpack.packb({"image": image}),
+                "application/msgpack",
+            ),
+        }
+
+        results = []
+        for name, (path, body, content_type) in bodies.items():
+            rate = throughput(client, path, body, content_type, args.requests)
+            results.append(f"{name}={rate:.1f} req/s ({len(body) / 1024:.0f} KiB)")
+
+        print(f"{size:>10}: " + " ".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare Faiss index types on the catalog features.
+
+Reports recall@k against IndexFlatL2, build time, single-query latency and
+memory per vector, after checking that every index type still returns the right
+products once a product is deleted. Run from the image_search directory:
+
+    python -m benchmarks.faiss_indexes --index_types hnsw ivfpq
+"""
+
+import argparse
+import time
+
+import numpy as np
+from config import settings
+from src.faiss_search.evaluation import compare_indexes
+from src.faiss_search.ingest_data import FaissIngest, apply_delta, with_product_ids
+from src.faiss_search.searcher import FaissSearch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Faiss index types")
+
+    parser.add_argument(
+        "--index_types",
+        nargs="+",
+        help="index types compared against the flat index",
+        default=["hnsw", "ivfpq"],
+    )
+    parser.add_argument(
+        "--num_vectors",
+        type=int,
+        help="number of catalog vectors to index (0 for all)",
+        default=0,
+    )
+    parser.add_argument(
+        "--top_k", type=int, help="k used for recall@k", default=settings.TOP_K
+    )
+
+    return parser.parse_args()
+
+
+def check_delete(index_faiss, features, index_type, num_queries=20):
+    """
+    Deletes the first product and checks the others are still found by id.
+
+    Queries are catalog vectors, so each should return its own product first,
+    both before and after the delete. HNSW indexes cannot delete and must refuse.
+    """
+    query_ids = np.linspace(1, len(features) - 1, num_queries, dtype=np.int64)
+    queries = features[query_ids]
+
+    if index_type == "hnsw":
+        try:
+            apply_delta(index_faiss, {"delete_ids": [0]})
+        except ValueError:
+            return
+        raise AssertionError("hnsw: deleting a product did not raise ValueError")
+
+    _, before = index_faiss.search(queries, 1)
+    counts = apply_delta(index_faiss, {"delete_ids": [0]})
+    _, after = index_faiss.search(queries, 1)
+    _, deleted = index_faiss.search(features[:1], 10)
+
+    assert counts["deleted"] == 1, f"{index_type}: {counts}"
+    assert index_faiss.ntotal == len(features) - 1, f"{index_type}: ntotal"
+    assert 0 not in deleted, f"{index_type}: deleted product still returned"
+    # Approximate indexes may miss a few queries, but the delete must not change
+    # the products they return
+    np.testing.assert_array_equal(after, before, err_msg=index_type)
+    assert (after[:, 0] == query_ids).mean() >= 0.9, f"{index_type}: wrong products"
+
+
+def main():
+    args = parse_args()
+
+    faiss_ingest = FaissIngest()
+    features = faiss_ingest.load_features()
+    if args.num_vectors:
+        features = features[: args.num_vectors]
+
+    indexes = {}
+    for index_type in args.index_types:
+        start_time = time.time()
+
+        index_faiss = faiss_ingest.build_index(
+            dimensions=features.shape[1], index_type=index_type
+        )
+        if not index_faiss.is_trained:
+            faiss_ingest.train_index(index_faiss, features, save=False)
+        index_faiss = with_product_ids(index_faiss)
+        faiss_ingest.add_features(index_faiss, features)
+
+        indexes[index_type] = (index_faiss, time.time() - start_time)
+        FaissSearch.configure_index(index_faiss)
+
+    compare_indexes(indexes, features, top_k=args.top_k)
+
+    # Deleting changes the indexes, so it runs after the report
+    for index_type in ["flat", *args.index_types]:
+        if index_type == "flat":
+            index_faiss = with_product_ids(
+                faiss_ingest.build_index(
+                    dimensions=features.shape[1], index_type="flat"
+                )
+            )
+            faiss_ingest.add_features(index_faiss, features)
+        else:
+            index_faiss = indexes[index_type][0]
+        check_delete(index_faiss, features, index_type)
+        print(f"{index_type}: delete check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare full-resolution JPEG decoding with the reduced-resolution (DCT-scaled)
+decoding of decode_image_bytes, from the compressed upload to the preprocessed
+model input.
+
+Synthetic photos of each upload size are encoded as JPEG. The preprocessed inputs
+of both paths are compared so the speedup can be weighed against the change in
+the model input. Run from the image_search directory:
+
+    python -m benchmarks.jpeg_decode --sizes 1080x1920 3000x4000
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from src.feature_extraction.preprocessing import Preprocessor
+from src.utils import decode_image_bytes
+from torchvision.io import ImageReadMode, decode_image
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark JPEG decoding")
+
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        help="upload sizes as HxW",
+        default=["480x640", "1080x1920", "2448x3264", "3000x4000"],
+    )
+    parser.add_argument("--quality", type=int, help="JPEG quality", default=90)
+    parser.add_argument("--runs", type=int, help="timed runs per size", default=20)
+
+    return parser.parse_args()
+
+
+def synthetic_jpeg(height, width, quality):
+    """
+    Encodes a smooth random image, closer to a photo than pure noise.
+    """
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BICUBIC)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+
+    return buffer.getvalue()
+
+
+def full_decode(contents):
+    data = torch.frombuffer(contents, dtype=torch.uint8)
+    return decode_image(data, mode=ImageReadMode.RGB)
+
+
+def cpu_time_ms(fn, contents, runs):
+    """
+    Returns the mean CPU time of ``fn`` in milliseconds.
+    """
+    fn(contents)
+
+    start_time = time.process_time()
+    for _ in range(runs):
+        fn(contents)
+
+    return (time.process_time() - start_time) * 1000 / runs
+
+
+def main():
+    args = parse_args()
+
+    # Decoding runs on single-threaded pool workers in the service
+    torch.set_num_threads(1)
+
+    preprocessor = Preprocessor()
+    buffer = torch.empty(1, 3, 300, 300)
+
+    def full_pipeline(contents):
+        return preprocessor(full_decode(contents), out=buffer)
+
+    def reduced_pipeline(contents):
+        return preprocessor(
+            decode_image_bytes(contents, min_size=preprocessor.resize_size), out=buffer
+        )
+
+    for size in args.sizes:
+        height, width = map(int, size.split("x"))
+        contents = synthetic_jpeg(height, width, args.quality)
+
+        decoded = decode_image_bytes(contents, min_size=preprocessor.resize_size)
+        assert min(decoded.shape[1:]) >= min(preprocessor.resize_size, height, width)
+
+        expected = preprocessor(full_decode(contents))
+        reduced = preprocessor(decoded)
+        max_diff = (expected - reduced).abs().max().item()
+        cosine = torch.nn.functional.cosine_similarity(
+            expected.flatten(), reduced.flatten(), dim=0
+        ).item()
+
+        full_ms = cpu_time_ms(full_pipeline, contents, args.runs)
+        reduced_ms = cpu_time_ms(reduced_pipeline, contents, args.runs)
+
+        print(
+            f"{size:>10} ({len(contents) / 1024:.0f} KiB, decoded "
+            f"{decoded.shape[1]}x{decoded.shape[2]}): full={full_ms:.2f}ms "
+            f"reduced={reduced_ms:.2f}ms speedup={full_ms / reduced_ms:.1f}x "
+            f"input cosine={cosine:.5f} max diff={max_diff:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Check the ONNX Runtime backend against eager PyTorch and compare their latency
+at batch 1 and batch 16. Export the model first with
+triton_server/pytorch_to_onnx.py, then run from the image_search directory:
+
+    python -m benchmarks.onnx_backend --model_path ./models/efficientnet_b3.onnx
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from config import settings
+from src.feature_extraction.onnx_backend import OnnxRuntimeModel
+from torchvision.models import EfficientNet_B3_Weights, efficientnet_b3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ONNX Runtime backend")
+
+    parser.add_argument(
+        "--model_path", help="onnx model path", default=settings.ONNX_MODEL_PATH
+    )
+    parser.add_argument(
+        "--batch_sizes", type=int, nargs="+", help="batch sizes", default=[1, 16]
+    )
+    parser.add_argument("--runs", type=int, help="timed runs per batch", default=20)
+    parser.add_argument(
+        "--atol", type=float, help="parity tolerance on the outputs", default=1.0e-2
+    )
+
+    return parser.parse_args()
+
+
+def measure(fn, images, runs):
+    """
+    Returns the output of ``fn`` and its mean latency in milliseconds.
+    """
+    output = fn(images)
+
+    start_time = time.time()
+    for _ in range(runs):
+        fn(images)
+
+    return output, (time.time() - start_time) * 1000 / runs
+
+
+def main():
+    args = parse_args()
+
+    torch_model = efficientnet_b3(weights=EfficientNet_B3_Weights.IMAGENET1K_V1)
+    torch_model.eval()
+
+    def torch_fn(images):
+        with torch.inference_mode():
+            return torch_model(torch.from_numpy(images)).numpy()
+
+    onnx_model = OnnxRuntimeModel(model_path=args.model_path)
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        images = rng.standard_normal((batch_size, 3, 300, 300), dtype=np.float32)
+
+        torch_result, torch_ms = measure(torch_fn, images, args.runs)
+        onnx_result, onnx_ms = measure(onnx_model, images, args.runs)
+
+        max_diff = np.abs(torch_result - onnx_result).max()
+        same_top1 = np.mean(torch_result.argmax(1) == onnx_result.argmax(1))
+
+        print(f"--batch {batch_size}--")
+        print(f"pytorch: {torch_ms:.2f}ms ({torch_ms / batch_size:.2f}ms/image)")
+        print(f"onnx:    {onnx_ms:.2f}ms ({onnx_ms / batch_size:.2f}ms/image)")
+        print(f"max abs diff: {max_diff:.2e}, same top-1: {same_top1:.2%}")
+
+        assert np.allclose(torch_result, onnx_result, atol=args.atol), (
+            "The outputs are different (Pytorch and ONNX Runtime)"
+        )
+
+    print("The numerical values are same (Pytorch and ONNX Runtime)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare result hydration from the columnar PayloadStore against per-row lookups
+into pandas Series. Run from the image_search directory:
+
+    python -m benchmarks.payload_store --top_k 20
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+from config import settings
+from src.faiss_search.payload_store import PayloadStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark result hydration")
+
+    parser.add_argument("--top_k", type=int, help="results per query", default=20)
+    parser.add_argument(
+        "--num_queries", type=int, help="queries per measurement", default=1000
+    )
+
+    return parser.parse_args()
+
+
+def series_gather(data, indices):
+    """
+    Hydrates results with per-row lookups into pandas Series.
+    """
+    results = []
+
+    for idx in indices:
+        sale_rate = 1 - (data["sale_item_price"][idx] / data["fixed_item_price"][idx])
+        results.append(
+            {
+                "item_path": data["item_path"][idx],
+                "item_image": data["item_image"][idx],
+                "item_name": data["item_name"][idx],
+                "fixed_item_price": data["fixed_item_price"][idx],
+                "sale_item_price": data["sale_item_price"][idx],
+                "sale_rate": sale_rate,
+                "sales_number": data["sales_number"][idx],
+                "shop_path": data["shop_path"][idx],
+                "shop_name": data["shop_name"][idx],
+            }
+        )
+
+    return results
+
+
+def main():
+    args = parse_args()
+
+    data = pd.read_csv(settings.DATA_PATH)
+    columns = {column: data[column] for column in data.columns}
+    payload_store = PayloadStore(data)
+
+    rng = np.random.default_rng(0)
+    queries = rng.integers(0, len(data), size=(args.num_queries, args.top_k))
+
+    series_time = timeit.timeit(
+        lambda: [series_gather(columns, indices) for indices in queries], number=1
+    )
+    store_time = timeit.timeit(
+        lambda: [payload_store.gather(indices) for indices in queries], number=1
+    )
+
+    print(f"Hydrating top-{args.top_k} results for {args.num_queries} queries")
+    print(f"pandas Series: {series_time / args.num_queries * 1e6:.1f} us/query")
+    print(f"PayloadStore:  {store_time / args.num_queries * 1e6:.1f} us/query")
+    print(f"Speedup: {series_time / store_time:.1f}x")
+    print(f"DataFrame memory:    {data.memory_usage(deep=True).sum() / 2**20:.1f} MiB")
+    print(f"PayloadStore memory: {payload_store.nbytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Evaluate the recall, latency and memory trade-off of PCA-reduced features.
+
+For every output dimensionality, fits a PCA projection on the catalog features,
+builds a flat index on the reduced vectors and measures recall@k against exact
+search on the full features. Run from the image_search directory:
+
+    python -m benchmarks.pca_tradeoff --dimensions 64 128 256 512
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+from config import settings
+from src.faiss_search.evaluation import evaluate_index, sample_queries
+from src.feature_extraction.reduction import FeatureReducer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark PCA reduction")
+
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        nargs="+",
+        help="output dimensionalities to evaluate",
+        default=[64, 128, 256, 512],
+    )
+    parser.add_argument("--whiten", action="store_true", help="whiten components")
+    parser.add_argument("--top_k", type=int, help="k used for recall@k", default=20)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    features = np.load(settings.FEATURES_PATH, allow_pickle=True)["image_features"]
+    features = np.ascontiguousarray(features, dtype="float32")
+
+    queries = sample_queries(features)
+
+    # Exact neighbors on the full features are the reference
+    full_index = faiss.IndexFlatL2(features.shape[1])
+    full_index.add(features)
+    _, ground_truth = full_index.search(queries, args.top_k)
+
+    report = {
+        features.shape[1]: evaluate_index(full_index, queries, ground_truth, args.top_k)
+    }
+    report[features.shape[1]]["fit_s"] = 0.0
+
+    for dimensions in args.dimensions:
+        start_time = time.time()
+        reducer = FeatureReducer.fit(
+            features, dimensions=dimensions, whiten=args.whiten
+        )
+        fit_time = time.time() - start_time
+
+        index = faiss.IndexFlatL2(dimensions)
+        index.add(reducer.transform(features))
+
+        report[dimensions] = evaluate_index(
+            index, reducer.transform(queries), ground_truth, args.top_k
+        )
+        report[dimensions]["fit_s"] = fit_time
+
+    print(
+        f"PCA trade-off on {len(queries)} queries, {features.shape[0]} vectors, "
+        f"recall@{args.top_k} against {features.shape[1]} dimensions:"
+    )
+    for dimensions, row in report.items():
+        print(
+            f"{dimensions:>5} dims: recall={row['recall']:.4f} "
+            f"latency={row['latency_ms']:.3f}ms "
+            f"memory={row['bytes_per_vector']:.1f}B/vector fit={row['fit_s']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Check the cached Preprocessor against the torchvision EfficientNet-B3 transforms
+and compare their per-image CPU time. The check fails with an AssertionError
+when any output, including one written into a pooled batch buffer, differs by
+more than --atol.
+
+The baseline rebuilds the transforms for every image, as the extractor used to.
+Run from the image_search directory:
+
+    python -m benchmarks.preprocessing --sizes 400x400 1200x1600
+"""
+
+import argparse
+import time
+
+import torch
+from src.feature_extraction.preprocessing import BufferPool, Preprocessor
+from torchvision.models import EfficientNet_B3_Weights
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing")
+
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        help="decoded image sizes as HxW",
+        default=["300x300", "480x640", "1200x1600"],
+    )
+    parser.add_argument("--runs", type=int, help="timed runs per size", default=50)
+    parser.add_argument(
+        "--atol", type=float, help="parity tolerance on the outputs", default=1.0e-5
+    )
+
+    return parser.parse_args()
+
+
+def transforms_baseline(image):
+    preprocess = EfficientNet_B3_Weights.IMAGENET1K_V1.transforms(antialias=True)
+    return preprocess(image).unsqueeze(0)
+
+
+def cpu_time_ms(fn, image, runs):
+    """
+    Returns the mean CPU time of ``fn`` in milliseconds.
+    """
+    fn(image)
+
+    start_time = time.process_time()
+    for _ in range(runs):
+        fn(image)
+
+    return (time.process_time() - start_time) * 1000 / runs
+
+
+def main():
+    args = parse_args()
+
+    # Preprocessing runs on single-threaded pool workers in the service
+    torch.set_num_threads(1)
+
+    preprocessor = Preprocessor()
+    buffer = torch.empty(1, 3, 300, 300)
+    buffer_pool = BufferPool(max_batch_size=4, num_buffers=1)
+
+    for size in args.sizes:
+        height, width = map(int, size.split("x"))
+        image = torch.randint(0, 256, (3, height, width), dtype=torch.uint8)
+
+        # The cached pipeline must match the torchvision transforms, on uint8
+        # images and on float images in [0, 1] as decoded from base64
+        for candidate in (image, image.float() / 255):
+            expected = transforms_baseline(candidate)
+            torch.testing.assert_close(
+                preprocessor(candidate), expected, atol=args.atol, rtol=0
+            )
+            torch.testing.assert_close(
+                preprocessor(candidate, out=buffer), expected, atol=args.atol, rtol=0
+            )
+
+        # Rows of a pooled batch buffer, reused by the second batch, must hold
+        # the same outputs as separate tensors
+        flipped = image.flip(-1)
+        for _ in range(2):
+            with buffer_pool.batch(3) as batch:
+                preprocessor(image, out=batch[0])
+                preprocessor(flipped.float() / 255, out=batch[1])
+                preprocessor(flipped, out=batch[2])
+            torch.testing.assert_close(
+                batch,
+                torch.cat(
+                    [
+                        transforms_baseline(image),
+                        transforms_baseline(flipped.float() / 255),
+                        transforms_baseline(flipped),
+                    ]
+                ),
+                atol=args.atol,
+                rtol=0,
+            )
+
+        baseline_ms = cpu_time_ms(transforms_baseline, image, args.runs)
+        cached_ms = cpu_time_ms(lambda x: preprocessor(x, out=buffer), image, args.runs)
+
+        print(
+            f"{size:>10}: transforms={baseline_ms:.3f}ms cached={cached_ms:.3f}ms "
+            f"saved={baseline_ms - cached_ms:.3f}ms/image"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Compare Qdrant collection profiles on the catalog features.
+
+For every profile, creates a temporary collection, uploads the features, waits
+for indexing to finish and measures p50/p99 single-query latency and recall@k
+against exact cosine search. Needs a running Qdrant, e.g. the docker-compose
+service. Run from the image_search directory:
+
+    python -m benchmarks.qdrant_profiles --profiles default int8 int8_on_disk
+"""
+
+import argparse
+import time
+
+import numpy as np
+from config import settings
+from qdrant_client import QdrantClient, grpc, models
+from src.faiss_search.evaluation import recall_at_k, sample_queries
+from src.feature_extraction.reduction import load_reducer
+from src.qdrant_search.ingest_data import collection_config
+from src.qdrant_search.searcher import search_params
+from src.utils import LOGGER
+
+# Collection settings and search parameters of each profile, on top of config.py
+PROFILES = {
+    "default": ({}, {}),
+    "hnsw_m32": ({"hnsw_m": 32, "hnsw_ef_construct": 200}, {}),
+    "on_disk": ({"on_disk": True}, {}),
+    "int8": ({"quantization": True}, {}),
+    "int8_no_rescore": ({"quantization": True}, {"rescore": False}),
+    "int8_on_disk": ({"quantization": True, "on_disk": True}, {}),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Qdrant profiles")
+
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=list(PROFILES),
+        help="collection profiles to compare",
+        default=list(PROFILES),
+    )
+    parser.add_argument(
+        "--num_vectors",
+        type=int,
+        help="number of catalog vectors to upload (0 for all)",
+        default=0,
+    )
+    parser.add_argument(
+        "--num_queries", type=int, help="number of queries", default=200
+    )
+    parser.add_argument("--top_k", type=int, help="k used for recall@k", default=20)
+    parser.add_argument(
+        "--batch_size", type=int, help="points per upload request", default=1000
+    )
+
+    return parser.parse_args()
+
+
+def exact_neighbors(features, queries, top_k):
+    """
+    Finds the exact cosine neighbors of the queries.
+
+    Returns:
+    - np.ndarray: Neighbor ids sorted by similarity. (Q, top_k)
+    """
+    features = features / np.linalg.norm(features, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    similarities = queries @ features.T
+    neighbors = np.argpartition(-similarities, top_k, axis=1)[:, :top_k]
+    order = np.argsort(-np.take_along_axis(similarities, neighbors, axis=1), axis=1)
+
+    return np.take_along_axis(neighbors, order, axis=1)
+
+
+def create_profile_collection(client, collection_name, features, profile, args):
+    """
+    Creates a collection with the given profile, uploads the features and waits
+    until the collection is fully indexed.
+
+    Returns:
+    - float: Seconds taken to upload and index the features.
+    """
+    client.grpc_collections.Delete(
+        grpc.DeleteCollection(collection_name=collection_name)
+    )
+    client.grpc_collections.Create(
+        grpc.CreateCollection(
+            collection_name=collection_name,
+            **collection_config(size=features.shape[1], **profile),
+            timeout=60,
+        )
+    )
+
+    start_time = time.time()
+    for start_idx in range(0, features.shape[0], args.batch_size):
+        end_idx = min(start_idx + args.batch_size, features.shape[0])
+        client.upsert(
+            collection_name=collection_name,
+            points=models.Batch(
+                ids=list(range(start_idx, end_idx)),
+                vectors=features[start_idx:end_idx].tolist(),
+            ),
+            wait=True,
+        )
+
+    # The collection turns green once the optimizers have built the index
+    while (
+        client.grpc_collections.Get(
+            grpc.GetCollectionInfoRequest(collection_name=collection_name)
+        ).result.status
+        != grpc.CollectionStatus.Green
+    ):
+        time.sleep(1)
+
+    return time.time() - start_time
+
+
+def evaluate_profile(client, collection_name, queries, ground_truth, params, args):
+    """
+    Measures single-query latency and recall@k of a collection.
+
+    Returns:
+    - dict: Recall@k and p50/p99 latency in milliseconds.
+    """
+    latencies = []
+    indices = []
+
+    for query in queries:
+        start_time = time.perf_counter()
+        response = client.grpc_points.Search(
+            grpc.SearchPoints(
+                collection_name=collection_name,
+                vector=query.tolist(),
+                limit=args.top_k,
+                params=search_params(**params),
+            )
+        )
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+        ids = [point.id.num for point in response.result]
+        indices.append(ids + [-1] * (args.top_k - len(ids)))
+
+    return {
+        "recall": recall_at_k(ground_truth, np.array(indices)),
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+    }
+
+
+def main():
+    args = parse_args()
+
+    client = QdrantClient(url=settings.QDRANT_URL, prefer_grpc=True)
+
+    features = np.load(settings.FEATURES_PATH, allow_pickle=True)["image_features"]
+    if args.num_vectors:
+        features = features[: args.num_vectors]
+    reducer = load_reducer()
+    if reducer is not None:
+        features = reducer.transform(features)
+    features = np.ascontiguousarray(features, dtype="float32")
+
+    queries = sample_queries(features, num_queries=args.num_queries)
+    ground_truth = exact_neighbors(features, queries, args.top_k)
+
+    report = {}
+    for name in args.profiles:
+        profile, params = PROFILES[name]
+        collection_name = f"{settings.QDRANT_COLLECTION}_benchmark_{name}"
+
+        build_time = create_profile_collection(
+            client, collection_name, features, profile, args
+        )
+        report[name] = {
+            "build_s": build_time,
+            **evaluate_profile(
+                client, collection_name, queries, ground_truth, params, args
+            ),
+        }
+
+        client.grpc_collections.Delete(
+            grpc.DeleteCollection(collection_name=collection_name)
+        )
+
+    LOGGER.info(
+        f"Qdrant profile report on {len(queries)} queries, {features.shape[0]} "
+        f"vectors, recall@{args.top_k}:"
+    )
+    for name, row in report.items():
+        LOGGER.info(
+            f"{name:>16}: recall={row['recall']:.4f} build={row['build_s']:.2f}s "
+            f"p50={row['p50_ms']:.3f}ms p99={row['p99_ms']:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Compare Triton inference with tensors sent in the gRPC messages against tensors
+passed through system shared memory.
+
+Needs a Triton server on the same host sharing /dev/shm, e.g. the CPU-only
+image with the ONNX model:
+
+    docker run --rm --ipc=host -p 8001:8001 \
+        -v $PWD/triton_server/model_repository:/models \
+        nvcr.io/nvidia/tritonserver:23.01-py3 tritonserver --model-repository=/models
+
+Then run from the image_search directory:
+
+    python -m benchmarks.triton_shm --model_name efficientnet_b3_onnx --concurrency 8
+"""
+
+import argparse
+import asyncio
+import time
+from functools import partial
+
+import numpy as np
+import torch
+import tritonclient.grpc.aio as grpcclient
+from config import settings
+from src.feature_extraction.triton_shm import TritonSharedMemoryPool
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Triton shared memory")
+
+    parser.add_argument(
+        "--url", help="Triton gRPC url", default=settings.TRITON_SERVER_URL
+    )
+    parser.add_argument(
+        "--model_name", help="Triton model name", default=settings.ONNX_MODEL_NAME
+    )
+    parser.add_argument("--batch_size", type=int, help="images per request", default=1)
+    parser.add_argument("--concurrency", type=int, help="requests in flight", default=8)
+    parser.add_argument(
+        "--num_requests", type=int, help="requests per transport", default=500
+    )
+
+    return parser.parse_args()
+
+
+async def grpc_infer(client, image, model_name):
+    """
+    Perform Triton inference with the tensors in the gRPC messages.
+    """
+    inputs = [
+        grpcclient.InferInput(settings.MODEL_INPUT_NAME, image.shape, datatype="FP32")
+    ]
+    outputs = [grpcclient.InferRequestedOutput(settings.MODEL_OUTPUT_NAME)]
+    inputs[0].set_data_from_numpy(image.numpy())
+
+    results = await client.infer(model_name=model_name, inputs=inputs, outputs=outputs)
+
+    return results.as_numpy(settings.MODEL_OUTPUT_NAME)
+
+
+async def run_load(infer_fn, image, args):
+    """
+    Sends ``num_requests`` requests with ``concurrency`` in flight.
+
+    Returns:
+    - dict: Throughput and p50/p99 latency in milliseconds.
+    """
+    latencies = []
+    remaining = iter(range(args.num_requests))
+
+    async def worker():
+        for _ in remaining:
+            start_time = time.perf_counter()
+            await infer_fn(image, args.model_name)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "images_per_s": args.num_requests * args.batch_size / elapsed,
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+    }
+
+
+async def benchmark(args):
+    client = grpcclient.InferenceServerClient(url=args.url)
+    pool = TritonSharedMemoryPool(
+        client, num_slots=args.concurrency, max_batch_size=args.batch_size
+    )
+
+    async def shm_infer(image, model_name):
+        return await pool.infer(
+            image,
+            model_name=model_name,
+            inputs_name=settings.MODEL_INPUT_NAME,
+            outputs_name=settings.MODEL_OUTPUT_NAME,
+        )
+
+    image = torch.rand(args.batch_size, 3, 300, 300)
+
+    try:
+        # Both transports must return the same features
+        np.testing.assert_allclose(
+            await shm_infer(image, args.model_name),
+            await grpc_infer(client, image, args.model_name),
+            rtol=1e-5,
+            atol=1e-5,
+        )
+
+        report = {
+            "grpc": await run_load(partial(grpc_infer, client), image, args),
+            "shm": await run_load(shm_infer, image, args),
+        }
+    finally:
+        await pool.close()
+        await client.close()
+
+    print(
+        f"{args.num_requests} requests of batch {args.batch_size}, "
+        f"concurrency {args.concurrency}:"
+    )
+    for name, row in report.items():
+        print(
+            f"{name:>5}: {row['images_per_s']:.1f} images/s "
+            f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms"
+        )
+
+
+def main():
+    asyncio.run(benchmark(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
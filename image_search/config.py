@@ -13,29 +13,132 @@ class Settings(BaseSettings):
     # Logging setting
     DATE_FMT: str = "%Y-%m-%d %H:%M:%S"
     LOG_DIR: str = f"{basedir}/logs/api.log"
+    LOG_TIMEZONE: str = "Asia/Ho_Chi_Minh"
+    LOG_JSON: bool = False  # one JSON object per line
+    LOG_QUEUE_SIZE: int = 10000  # records beyond are dropped, never blocking
+    # Fraction of INFO records kept per module file name, e.g. {"batcher": 0.1}
+    LOG_SAMPLE_RATES: dict[str, float] = {}
 
+    # Admin endpoints are disabled unless a token is set
+    ADMIN_TOKEN: str = os.environ.get("ADMIN_TOKEN", "")
+
+    # Uploaded images are only saved for a sample of requests
     IMAGEDIR: str = "assets/uploaded_images/"
+    UPLOAD_SAMPLE_RATE: float = 0.0
+    UPLOAD_RETENTION: int = 1000
+
+    # Larger uploads are rejected with 413 before decoding
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_MAX_PIXELS: int = 50_000_000
 
     # Search configuration
     FEATURES_PATH: str = "./data/image_features.npz"
     DATA_PATH: str = "./data/data.csv"
     DIMENSIONS: int = 1000
     TOP_K: int = 3
+    SEARCH_BATCH_MAX_IMAGES: int = 64
+
+    # PCA reduction configuration (fit with train_pca.py, then rebuild the indexes)
+    PCA_ENABLED: bool = False
+    PCA_DIMENSIONS: int = 256
+    PCA_WHITEN: bool = False
+    PCA_TRAIN_SIZE: int = 100000
+    PCA_PATH: str = "./data/pca.faiss"
 
     # Faiss configuration
     INDEX_PATH: str = "./src/faiss_search/index.faiss"
+    INDEX_TYPE: str = "flat"  # flat | hnsw | ivfpq
+    INGEST_CHUNK_SIZE: int = 10000
+    INDEX_MMAP: bool = False
+    INDEX_PREWARM: bool = True
+    INDEX_REPORT_QUERIES: int = 1000
+    INDEX_REPORT_TOP_K: int = 20
+    INDEX_WATCH_INTERVAL: float = 30.0  # seconds between file checks, 0 disables
+
+    # Faiss HNSW configuration
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 128
+
+    # Faiss IVF-PQ configuration
+    IVF_NLIST: int = 256
+    IVF_NPROBE: int = 16
+    IVF_TRAIN_SIZE: int = 50000
+    PQ_M: int = 100
+    PQ_NBITS: int = 8
+    TRAINED_INDEX_PATH: str = "./src/faiss_search/index.trained.faiss"
+    TRAINED_INDEX_META_PATH: str = "./src/faiss_search/index.trained.json"
+    QUANTIZER_PATH: str = "./src/faiss_search/quantizer.faiss"
 
     # Qdrant configuration
     QDRANT_URL: str = os.environ.get("QDRANT_URL", "http://localhost:6334")
     QDRANT_COLLECTION: str = "image_search"
+    QDRANT_BATCH_SIZE: int = 1000
+    QDRANT_UPLOAD_WORKERS: int = 4
+    QDRANT_CHECKPOINT_PATH: str = "./data/qdrant_ingest.checkpoint.json"
+
+    # Qdrant collection profile, applied when the collection is created
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    QDRANT_HNSW_EF: int = 128
+    QDRANT_INDEXING_THRESHOLD: int = 20000
+    QDRANT_SEGMENT_NUMBER: int = 0  # 0 lets Qdrant choose
+    QDRANT_ON_DISK: bool = False
+    QDRANT_QUANTIZATION: bool = False  # int8 scalar quantization
+    QDRANT_QUANTIZATION_QUANTILE: float = 0.99
+    QDRANT_QUANTIZATION_ALWAYS_RAM: bool = True
+    QDRANT_QUANTIZATION_RESCORE: bool = True
+
+    # Local inference configuration
+    INFERENCE_BACKEND: str = "torch"  # torch | onnxruntime | onnxruntime_int8
+    ONNX_MODEL_PATH: str = "./models/efficientnet_b3.onnx"
+    ONNX_INT8_MODEL_PATH: str = "./models/efficientnet_b3_int8.onnx"
+    ORT_INTRA_OP_THREADS: int = 0
+    ORT_INTER_OP_THREADS: int = 1
+    ORT_GRAPH_OPTIMIZATION: str = "all"  # disabled | basic | extended | all
+    ORT_WARMUP_RUNS: int = 3
 
     # Triton configuration
     TRITON_SERVER_URL: str = os.environ.get("TRITON_SERVER_URL", "localhost:9001")
     PYTORCH_MODEL_NAME: str = "efficientnet_b3"
     ONNX_MODEL_NAME: str = "efficientnet_b3_onnx"
     TENSORRT_MODEL_NAME: str = "efficientnet_b3_trt"
+    ENSEMBLE_MODEL_NAME: str = "efficientnet_b3_ensemble"  # decodes bytes in Triton
+    ENSEMBLE_INPUT_NAME: str = "image"
+    TRITON_SERVER_PREPROCESS: bool = False
     MODEL_INPUT_NAME: str = "input"
     MODEL_OUTPUT_NAME: str = "output"
 
+    # Triton gRPC channel pool
+    TRITON_CHANNELS: int = 4
+    TRITON_CHANNEL_SELECTION: str = "least_in_flight"  # round_robin | least_in_flight
+    TRITON_CHANNEL_MAX_IN_FLIGHT: int = 32
+    TRITON_KEEPALIVE_TIME_MS: int = 30000
+    TRITON_KEEPALIVE_TIMEOUT_MS: int = 10000
+    TRITON_CHANNEL_RETRY_SECONDS: float = 5.0  # cooldown after a transport error
+
+    # Triton system shared memory, only when Triton shares /dev/shm with the API
+    TRITON_SHM_ENABLED: bool = False
+    TRITON_SHM_SLOTS: int = 8
+
+    # Micro-batching configuration (set BATCH_MAX_SIZE=1 to disable coalescing)
+    BATCH_MAX_SIZE: int = 16
+    BATCH_MAX_WAIT_MS: float = 5.0
+    BATCH_MAX_IN_FLIGHT: int = 4  # concurrent batches per Triton model
+
+    # Query embedding cache configuration
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_TTL_SECONDS: float = 3600
+    CACHE_FLOAT16: bool = False
+    CACHE_REDIS_URL: str = os.environ.get("CACHE_REDIS_URL", "")
+    CACHE_REDIS_TIMEOUT_SECONDS: float = 0.1
+
+    # Execution pools configuration
+    PREPROCESS_WORKERS: int = 4
+    INFERENCE_WORKERS: int = 1
+    SEARCH_WORKERS: int = 2
+    POOL_MAX_QUEUE: int = 64
+
 
 settings = Settings()
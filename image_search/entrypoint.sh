@@ -7,4 +7,4 @@ python faiss_ingest.py
 # python qdrant_ingest.py
 
 echo "Run app with uvicorn server..."
-uvicorn app:app --port 7000 --host 0.0.0.0 --workers 1
+uvicorn app:app --port 7000 --host 0.0.0.0 --workers ${WORKERS:-1}
@@ -0,0 +1,233 @@
+"""
+Extract catalog features into image_features.npz, aligned row-for-row with
+data.csv.
+
+Images are read either from a directory of files named by their data.csv row
+(``0.jpg``, ``1.jpg``, ...) or from a manifest CSV with one image path per
+data.csv row. They are decoded by a multi-process loader, run through
+FeatureExtractor in batches and written as shards, so an interrupted run resumes
+from the last completed shard. Rows whose image is missing or cannot be decoded
+get a zero vector and are marked invalid.
+
+    python extract_features.py --image_dir ./data/images --num_workers 8
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from config import settings
+from src.feature_extraction.extractor import FeatureExtractor
+from src.feature_extraction.preprocessing import Preprocessor
+from src.utils import LOGGER, decode_image_bytes
+from torch.utils.data import DataLoader, Dataset
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract catalog image features")
+
+    parser.add_argument("--data_path", help="catalog csv", default=settings.DATA_PATH)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--image_dir", help="directory of images named by row")
+    source.add_argument("--manifest", help="csv with one image path per row")
+    parser.add_argument(
+        "--path_column", help="image path column of the manifest", default="image_path"
+    )
+    parser.add_argument(
+        "--shard_dir", help="directory of resumable shards", default="./data/shards"
+    )
+    parser.add_argument(
+        "--output_path", help="merged features file", default=settings.FEATURES_PATH
+    )
+    parser.add_argument("--shard_size", type=int, help="rows per shard", default=10000)
+    parser.add_argument("--batch_size", type=int, help="inference batch", default=32)
+    parser.add_argument(
+        "--num_workers", type=int, help="image decoding processes", default=4
+    )
+
+    return parser.parse_args()
+
+
+def resolve_image_paths(args, num_rows):
+    """
+    Maps every data.csv row to its image path.
+
+    Returns:
+    - list: Image path of every row, None where no image exists.
+    """
+    if args.manifest:
+        manifest = pd.read_csv(args.manifest)
+        if len(manifest) != num_rows:
+            raise ValueError(
+                f"Manifest has {len(manifest)} rows, data.csv has {num_rows} rows."
+            )
+        return [
+            path if isinstance(path, str) else None
+            for path in manifest[args.path_column]
+        ]
+
+    image_paths = [None] * num_rows
+    for image_path in glob.glob(os.path.join(args.image_dir, "*")):
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        if stem.isdigit() and int(stem) < num_rows:
+            image_paths[int(stem)] = image_path
+
+    return image_paths
+
+
+class CatalogImages(Dataset):
+    """
+    Decodes and preprocesses catalog images in loader worker processes.
+    """
+
+    def __init__(self, image_paths):
+        self.image_paths = image_paths
+        self.preprocess = Preprocessor()
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        image_path = self.image_paths[idx]
+
+        try:
+            with open(image_path, "rb") as f:
+                image = self.preprocess(decode_image_bytes(f.read()))[0]
+            return image, True
+        except Exception:
+            return torch.zeros(3, 300, 300), False
+
+
+def extract_shard(feature_extractor, image_paths, args):
+    """
+    Extracts the features of one shard of rows.
+
+    Returns:
+    - tuple: Features (N, DIMENSIONS) and validity mask (N,).
+    """
+    loader = DataLoader(
+        CatalogImages(image_paths),
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        pin_memory=torch.cuda.is_available(),
+    )
+
+    features = []
+    valid = []
+    for images, is_valid in loader:
+        features.append(feature_extractor.extract_batch(images))
+        valid.append(is_valid.numpy())
+
+    features = np.concatenate(features).astype(np.float32)
+    valid = np.concatenate(valid)
+    features[~valid] = 0
+
+    return features, valid
+
+
+def check_shard(shard_path, start_idx, end_idx, shard_size, num_rows):
+    """
+    Checks that a shard left by a previous run covers the rows this run expects,
+    so a changed --shard_size or data.csv is not merged out of alignment.
+
+    Raises:
+    - ValueError: If the shard does not match the current run.
+    """
+    with np.load(shard_path) as data:
+        stored = {
+            "start": int(data["start"]),
+            "length": len(data["image_features"]),
+            "shard_size": int(data["shard_size"]) if "shard_size" in data else None,
+            "num_rows": int(data["num_rows"]) if "num_rows" in data else None,
+        }
+
+    expected = {
+        "start": start_idx,
+        "length": end_idx - start_idx,
+        "shard_size": shard_size,
+        "num_rows": num_rows,
+    }
+    if stored != expected:
+        raise ValueError(
+            f"{shard_path} was extracted with {stored}, this run expects {expected}. "
+            "Remove the shard directory to extract again."
+        )
+
+
+def main():
+    args = parse_args()
+
+    num_rows = len(pd.read_csv(args.data_path))
+    image_paths = resolve_image_paths(args, num_rows)
+    os.makedirs(args.shard_dir, exist_ok=True)
+
+    feature_extractor = FeatureExtractor()
+
+    num_shards = (num_rows + args.shard_size - 1) // args.shard_size
+    start_time = time.time()
+    num_extracted = 0
+
+    for shard in range(num_shards):
+        shard_path = os.path.join(args.shard_dir, f"shard_{shard:05d}.npz")
+        start_idx = shard * args.shard_size
+        end_idx = min(start_idx + args.shard_size, num_rows)
+
+        if os.path.exists(shard_path):
+            check_shard(shard_path, start_idx, end_idx, args.shard_size, num_rows)
+            LOGGER.info(f"Shard {shard + 1}/{num_shards} already extracted, skip.")
+            continue
+
+        shard_start_time = time.time()
+        features, valid = extract_shard(
+            feature_extractor, image_paths[start_idx:end_idx], args
+        )
+
+        # Write atomically so that an interrupted shard is extracted again
+        tmp_path = shard_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            image_features=features,
+            valid=valid,
+            start=start_idx,
+            shard_size=args.shard_size,
+            num_rows=num_rows,
+        )
+        os.replace(tmp_path, shard_path)
+
+        num_extracted += end_idx - start_idx
+        LOGGER.info(
+            f"Shard {shard + 1}/{num_shards}: {end_idx - start_idx} images, "
+            f"{int((~valid).sum())} invalid, "
+            f"{(end_idx - start_idx) / (time.time() - shard_start_time):.1f} images/sec"
+        )
+
+    if num_extracted:
+        LOGGER.info(
+            f"Extracted {num_extracted} images at "
+            f"{num_extracted / (time.time() - start_time):.1f} images/sec"
+        )
+
+    # Merge the shards in row order
+    features = []
+    valid = []
+    for shard in range(num_shards):
+        with np.load(os.path.join(args.shard_dir, f"shard_{shard:05d}.npz")) as data:
+            features.append(data["image_features"])
+            valid.append(data["valid"])
+
+    features = np.concatenate(features)
+    if len(features) != num_rows:
+        raise ValueError(
+            f"Merged shards have {len(features)} rows, data.csv has {num_rows} rows."
+        )
+
+    np.savez(args.output_path, image_features=features, valid=np.concatenate(valid))
+    LOGGER.info(f"Features of {num_rows} rows saved to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
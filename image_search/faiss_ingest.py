@@ -1,15 +1,37 @@
+import argparse
+
 from src.faiss_search.ingest_data import FaissIngest
 from src.utils import LOGGER
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest features into Faiss")
+
+    parser.add_argument(
+        "--delta",
+        help="npz file of upsert_ids, upsert_features and delete_ids to apply "
+        "to the existing index",
+        default=None,
+    )
+
+    return parser.parse_args()
+
+
 def main():
     """
     Main function to perform QdrantIngest data ingestion.
     """
+    args = parse_args()
+
     # Create an instance of FaissIngest
     faiss_ingest = FaissIngest()
 
-    if faiss_ingest.check_index_exists():
+    if args.delta:
+        LOGGER.info(f"Update Index in Faiss with {args.delta}!")
+
+        # Upsert and delete products of the saved index
+        faiss_ingest.update_index(args.delta)
+    elif faiss_ingest.check_index_exists():
         LOGGER.info("Index in Faiss already exists!")
     else:
         LOGGER.info("Create Index in Faiss!")
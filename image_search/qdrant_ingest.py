@@ -16,9 +16,20 @@ def main():
         LOGGER.info(f"Error checking collection: {e}")
 
         LOGGER.info("Create collection!")
+        # Until the checkpoint is removed by add_points, the collection is
+        # treated as partially ingested
+        qdrant_ingest.start_checkpoint()
         response = qdrant_ingest.create_collection()
         LOGGER.info(response)
 
+        qdrant_ingest.create_payload_indexes()
+        qdrant_ingest.add_points()
+        return
+
+    # Finish an ingestion that was interrupted
+    if qdrant_ingest.has_checkpoint():
+        LOGGER.info("Resume adding points to the collection!")
+        qdrant_ingest.create_payload_indexes()
         qdrant_ingest.add_points()
 
 
@@ -0,0 +1,226 @@
+"""
+Quantize the exported EfficientNet-B3 ONNX model to INT8 for CPU inference.
+
+Calibrates ONNX Runtime static quantization on a sample of the catalog images
+that extract_features.py reads, then gates the result on retrieval quality: query features from the FP32 and INT8 models are
+searched against the catalog features and their top-k overlap must reach
+--min_overlap before the INT8 model is written to --output_path. Select it with
+INFERENCE_BACKEND=onnxruntime_int8.
+
+    python quantize_model.py --image_dir ./data/images --num_samples 400
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import faiss
+import numpy as np
+import pandas as pd
+from config import settings
+from extract_features import resolve_image_paths
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from src.feature_extraction.onnx_backend import OnnxRuntimeModel
+from src.feature_extraction.preprocessing import Preprocessor
+from src.utils import LOGGER, decode_image_bytes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Quantize ONNX model to INT8")
+
+    parser.add_argument(
+        "--model_path", help="fp32 onnx model path", default=settings.ONNX_MODEL_PATH
+    )
+    parser.add_argument(
+        "--output_path",
+        help="int8 onnx model path",
+        default=settings.ONNX_INT8_MODEL_PATH,
+    )
+    parser.add_argument("--data_path", help="catalog csv", default=settings.DATA_PATH)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--image_dir",
+        help="directory of catalog images named by row",
+        default="./data/images",
+    )
+    source.add_argument("--manifest", help="csv with one image path per row")
+    parser.add_argument(
+        "--path_column", help="image path column of the manifest", default="image_path"
+    )
+    parser.add_argument(
+        "--num_samples",
+        type=int,
+        help="number of catalog images sampled for calibration and evaluation",
+        default=400,
+    )
+    parser.add_argument(
+        "--calibration_fraction",
+        type=float,
+        help="fraction of the samples used for calibration, the rest evaluates",
+        default=0.5,
+    )
+    parser.add_argument(
+        "--calibrate_method",
+        help="activation range calibration",
+        choices=["MinMax", "Entropy", "Percentile"],
+        default="MinMax",
+    )
+    parser.add_argument("--top_k", type=int, help="k used for overlap", default=20)
+    parser.add_argument(
+        "--min_overlap",
+        type=float,
+        help="minimum mean top-k overlap with fp32 retrieval to ship the model",
+        default=0.9,
+    )
+
+    return parser.parse_args()
+
+
+def sample_images(args):
+    """
+    Samples catalog images and splits them into calibration and evaluation sets.
+
+    Returns:
+    - tuple: Disjoint lists of calibration and evaluation image paths.
+    """
+    num_rows = len(pd.read_csv(args.data_path))
+    image_paths = [
+        path for path in resolve_image_paths(args, num_rows) if path is not None
+    ]
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(image_paths))[: args.num_samples]
+    image_paths = [image_paths[idx] for idx in order]
+    num_calibration = int(round(len(image_paths) * args.calibration_fraction))
+
+    return image_paths[:num_calibration], image_paths[num_calibration:]
+
+
+def load_images(image_paths):
+    """
+    Decodes and preprocesses images like the search endpoints do.
+
+    Returns:
+    - numpy.ndarray: Preprocessed images. (N, 3, 300, 300)
+    """
+    preprocess = Preprocessor()
+
+    images = []
+    for image_path in image_paths:
+        with open(image_path, "rb") as f:
+            images.append(preprocess(decode_image_bytes(f.read()))[0].numpy())
+
+    return np.stack(images)
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Feeds preprocessed sample images to the quantization calibrator one by one.
+    """
+
+    def __init__(self, images, input_name):
+        self.images = iter(images)
+        self.input_name = input_name
+
+    def get_next(self):
+        image = next(self.images, None)
+        if image is None:
+            return None
+
+        return {self.input_name: image[None]}
+
+
+def retrieval_overlap(fp32_features, int8_features, top_k):
+    """
+    Measures how much of the fp32 top-k catalog neighbors the int8 features keep.
+
+    Returns:
+    - float: Mean top-k overlap over the evaluation queries.
+    """
+    catalog = np.load(settings.FEATURES_PATH, allow_pickle=True)["image_features"]
+    index = faiss.IndexFlatL2(catalog.shape[1])
+    index.add(np.ascontiguousarray(catalog, dtype="float32"))
+
+    _, fp32_ids = index.search(np.ascontiguousarray(fp32_features), top_k)
+    _, int8_ids = index.search(np.ascontiguousarray(int8_features), top_k)
+
+    return np.mean(
+        [len(np.intersect1d(a, b)) / top_k for a, b in zip(fp32_ids, int8_ids)]
+    )
+
+
+def main():
+    args = parse_args()
+
+    calibration_paths, evaluation_paths = sample_images(args)
+    if not calibration_paths or not evaluation_paths:
+        LOGGER.error(
+            f"Not enough catalog images in {args.manifest or args.image_dir} "
+            f"for calibration and evaluation"
+        )
+        sys.exit(1)
+
+    LOGGER.info(
+        f"Quantize with {len(calibration_paths)} calibration and "
+        f"{len(evaluation_paths)} evaluation images"
+    )
+
+    fp32_model = OnnxRuntimeModel(model_path=args.model_path, warmup_runs=0)
+
+    # Work next to the output so the final rename stays on one filesystem
+    output_dir = os.path.dirname(os.path.abspath(args.output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        # Shape inference and graph optimization before quantization
+        prepared_path = os.path.join(tmp_dir, "prepared.onnx")
+        quant_pre_process(args.model_path, prepared_path)
+
+        int8_path = os.path.join(tmp_dir, "int8.onnx")
+        quantize_static(
+            prepared_path,
+            int8_path,
+            ImageCalibrationReader(
+                load_images(calibration_paths), fp32_model.input_name
+            ),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=getattr(CalibrationMethod, args.calibrate_method),
+        )
+
+        # Accuracy gate on top-k retrieval overlap
+        int8_model = OnnxRuntimeModel(model_path=int8_path, warmup_runs=0)
+        evaluation_images = load_images(evaluation_paths)
+        fp32_features = np.concatenate(
+            [fp32_model(image[None]) for image in evaluation_images]
+        )
+        int8_features = np.concatenate(
+            [int8_model(image[None]) for image in evaluation_images]
+        )
+
+        overlap = retrieval_overlap(fp32_features, int8_features, args.top_k)
+        LOGGER.info(f"INT8 top-{args.top_k} retrieval overlap with FP32: {overlap:.4f}")
+
+        if overlap < args.min_overlap:
+            LOGGER.error(
+                f"Overlap below {args.min_overlap}, INT8 model is not written."
+            )
+            sys.exit(1)
+
+        os.replace(int8_path, args.output_path)
+
+    LOGGER.info(f"INT8 model saved to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+
+
+class BoundedExecutor:
+    """
+    A thread pool that runs blocking work off the event loop with a bounded queue.
+
+    Submissions beyond ``max_workers + max_queue`` outstanding tasks wait on the
+    event loop instead of piling up in the pool, which gives natural backpressure.
+    Torch and Faiss release the GIL during heavy computation, so threads are
+    enough to keep the event loop responsive without duplicating the model or
+    index in several processes.
+
+    Attributes:
+        name (str): Name of the pool, used as thread name prefix and in statistics.
+        max_workers (int): Number of worker threads.
+        max_queue (int): Maximum number of tasks waiting for a free worker.
+    """
+
+    def __init__(self, name, max_workers, max_queue=settings.POOL_MAX_QUEUE):
+        """
+        Initializes the BoundedExecutor.
+
+        Args:
+        - name (str): Name of the pool.
+        - max_workers (int): Number of worker threads.
+        - max_queue (int): Maximum number of tasks waiting for a free worker.
+        """
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f"{name}-pool"
+        )
+        # Created lazily so that it binds to the running event loop
+        self._slots = None
+        self._lock = threading.Lock()
+
+        # Pool statistics
+        self.waiting = 0
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _call(self, fn, args, kwargs):
+        """
+        Runs a task on a worker thread while tracking the number of active tasks.
+        """
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs a blocking function in the pool and awaits its result.
+
+        Args:
+        - fn (Callable): The blocking function to run.
+        - *args, **kwargs: Arguments passed to the function.
+
+        Returns:
+        - The return value of the function.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        try:
+            with self._lock:
+                self.queued += 1
+
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor, self._call, fn, args, kwargs
+            )
+            self.completed += 1
+            return result
+
+        except Exception:
+            self.failed += 1
+            raise
+
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """
+        Returns the pool's size and queue depth.
+
+        Returns:
+        - dict: Pool configuration and counters of waiting, queued, active,
+          completed and failed tasks.
+        """
+        return {
+            "name": self.name,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self):
+        """
+        Shuts down the worker threads.
+        """
+        self._executor.shutdown(wait=False)
+
+
+class ExecutionPools:
+    """
+    Separate pools for each stage of the search pipeline, so that a slow stage
+    cannot starve the others.
+
+    Attributes:
+        preprocess (BoundedExecutor): Pool for image decoding and preprocessing.
+        inference (BoundedExecutor): Pool for local model inference.
+        search (BoundedExecutor): Pool for Faiss index search.
+    """
+
+    def __init__(self):
+        """
+        Initializes the pools with the sizes from the settings.
+        """
+        self.preprocess = BoundedExecutor(
+            name="preprocess", max_workers=settings.PREPROCESS_WORKERS
+        )
+        self.inference = BoundedExecutor(
+            name="inference", max_workers=settings.INFERENCE_WORKERS
+        )
+        self.search = BoundedExecutor(
+            name="search", max_workers=settings.SEARCH_WORKERS
+        )
+
+    def stats(self):
+        """
+        Returns the statistics of every pool.
+
+        Returns:
+        - list: A list of dictionaries, one per pool.
+        """
+        return [pool.stats() for pool in (self.preprocess, self.inference, self.search)]
+
+    def shutdown(self):
+        """
+        Shuts down every pool.
+        """
+        for pool in (self.preprocess, self.inference, self.search):
+            pool.shutdown()
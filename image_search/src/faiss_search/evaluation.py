@@ -0,0 +1,165 @@
+import time
+
+import faiss
+import numpy as np
+from config import settings
+from src.utils import LOGGER
+
+
+def sample_queries(vectors, num_queries=settings.INDEX_REPORT_QUERIES, seed=0):
+    """
+    Samples query vectors from the indexed vectors.
+
+    Args:
+    - vectors (np.ndarray): The indexed vectors. (N, D)
+    - num_queries (int): Number of queries to sample.
+    - seed (int): Seed of the random generator.
+
+    Returns:
+    - np.ndarray: The sampled query vectors. (num_queries, D)
+    """
+    rng = np.random.default_rng(seed)
+    num_queries = min(num_queries, vectors.shape[0])
+    query_ids = rng.choice(vectors.shape[0], size=num_queries, replace=False)
+
+    return np.ascontiguousarray(vectors[query_ids], dtype="float32")
+
+
+def recall_at_k(ground_truth, indices):
+    """
+    Computes the fraction of the exact top-k neighbors found by an index.
+
+    Args:
+    - ground_truth (np.ndarray): Exact neighbor ids. (Q, k)
+    - indices (np.ndarray): Neighbor ids returned by the index. (Q, k)
+
+    Returns:
+    - float: Recall@k averaged over all queries.
+    """
+    found = sum(
+        len(np.intersect1d(truth, result[result >= 0]))
+        for truth, result in zip(ground_truth, indices)
+    )
+
+    return found / ground_truth.size
+
+
+def index_memory_per_vector(index):
+    """
+    Measures the serialized size of an index per stored vector.
+
+    Args:
+    - index (faiss.Index): The index to measure.
+
+    Returns:
+    - float: Bytes per stored vector.
+    """
+    return faiss.serialize_index(index).size / max(index.ntotal, 1)
+
+
+def evaluate_index(index, queries, ground_truth, top_k=settings.INDEX_REPORT_TOP_K):
+    """
+    Measures recall@k, query latency and memory of an index.
+
+    Args:
+    - index (faiss.Index): The index to evaluate.
+    - queries (np.ndarray): Query vectors. (Q, D)
+    - ground_truth (np.ndarray): Exact neighbor ids of the queries. (Q, top_k)
+    - top_k (int): Number of neighbors to retrieve.
+
+    Returns:
+    - dict: Recall@k, mean latency in milliseconds for single-query searches and
+      bytes per vector.
+    """
+    start_time = time.time()
+    indices = np.concatenate(
+        [index.search(query[None, :], top_k)[1] for query in queries]
+    )
+    latency_ms = (time.time() - start_time) * 1000 / len(queries)
+
+    return {
+        "recall": recall_at_k(ground_truth, indices),
+        "latency_ms": latency_ms,
+        "bytes_per_vector": index_memory_per_vector(index),
+    }
+
+
+def compare_indexes(indexes, vectors, top_k=settings.INDEX_REPORT_TOP_K, ids=None):
+    """
+    Logs a report comparing approximate indexes against an exact IndexFlatL2.
+
+    Args:
+    - indexes (dict): Maps an index name to a tuple of the index, already filled
+      with ``vectors``, and the time in seconds taken to build it.
+    - vectors (np.ndarray): The indexed vectors. (N, D)
+    - top_k (int): Number of neighbors used for recall@k.
+    - ids (np.ndarray, optional): Product ids the indexes return for
+      ``vectors``, their positions by default. (N,)
+
+    Returns:
+    - dict: The report of every index, keyed by index name.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+
+    start_time = time.time()
+    flat_index = faiss.IndexFlatL2(vectors.shape[1])
+    if ids is None:
+        flat_index.add(vectors)
+    else:
+        flat_index = faiss.IndexIDMap(flat_index)
+        flat_index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    flat_build_time = time.time() - start_time
+
+    queries = sample_queries(vectors)
+    _, ground_truth = flat_index.search(queries, top_k)
+
+    report = {
+        "flat": {
+            "build_s": flat_build_time,
+            **evaluate_index(flat_index, queries, ground_truth, top_k),
+        }
+    }
+    for name, (index, build_time) in indexes.items():
+        report[name] = {
+            "build_s": build_time,
+            **evaluate_index(index, queries, ground_truth, top_k),
+        }
+
+    LOGGER.info(
+        f"Index report on {len(queries)} queries, {vectors.shape[0]} vectors, "
+        f"recall@{top_k}:"
+    )
+    for name, row in report.items():
+        LOGGER.info(
+            f"{name:>8}: recall={row['recall']:.4f} build={row['build_s']:.2f}s "
+            f"latency={row['latency_ms']:.3f}ms "
+            f"memory={row['bytes_per_vector']:.1f}B/vector"
+        )
+
+    return report
+
+
+def compare_with_flat(
+    index,
+    build_time,
+    vectors,
+    name=settings.INDEX_TYPE,
+    top_k=settings.INDEX_REPORT_TOP_K,
+    ids=None,
+):
+    """
+    Logs a report comparing an approximate index against an exact IndexFlatL2.
+
+    Args:
+    - index (faiss.Index): The approximate index, already filled with ``vectors``.
+    - build_time (float): Time in seconds taken to build the approximate index.
+    - vectors (np.ndarray): The indexed vectors. (N, D)
+    - name (str): Name of the approximate index in the report.
+    - top_k (int): Number of neighbors used for recall@k.
+    - ids (np.ndarray, optional): Product ids the index returns for ``vectors``,
+      their positions by default. (N,)
+
+    Returns:
+    - dict: The report of both indexes, keyed by index name.
+    """
+    return compare_indexes({name: (index, build_time)}, vectors, top_k, ids=ids)
@@ -1,8 +1,13 @@
+import json
 import os
+import time
 
 import faiss
 import numpy as np
 from config import settings
+from src.faiss_search.evaluation import compare_with_flat
+from src.faiss_search.searcher import FaissSearch
+from src.feature_extraction.reduction import load_reducer
 from src.utils import LOGGER, time_profiling
 
 
@@ -12,6 +17,7 @@ class FaissIngest:
 
     Attributes:
         image_features (numpy.ndarray): Array of features to be indexed.
+        reducer (FeatureReducer): PCA reduction applied before indexing, or None.
     """
 
     def __init__(self):
@@ -21,25 +27,417 @@ class FaissIngest:
         # Load array features from the specified file
         self.image_features = np.load(settings.FEATURES_PATH, allow_pickle=True)
 
+        # Load the PCA reduction, if enabled
+        self.reducer = load_reducer()
+
     def check_index_exists(self):
         return os.path.exists(settings.INDEX_PATH)
 
+    def load_features(self):
+        """
+        Loads the features to be indexed, reduced with PCA if enabled.
+
+        Returns:
+            numpy.ndarray: The features to be indexed.
+        """
+        features = self.image_features["image_features"]
+
+        if self.reducer is not None:
+            features = self.reducer.transform(features)
+
+        return features
+
+    def load_valid(self):
+        """
+        Loads which data.csv rows have features. Rows whose image could not be
+        decoded hold zero vectors and are not indexed.
+
+        Returns:
+            numpy.ndarray: Validity mask of every row, all True for feature files
+                without one.
+        """
+        if "valid" not in self.image_features:
+            return np.ones(len(self.image_features["image_features"]), dtype=bool)
+
+        return self.image_features["valid"].astype(bool)
+
+    def build_index(
+        self, dimensions=settings.DIMENSIONS, index_type=settings.INDEX_TYPE
+    ):
+        """
+        Creates an empty Faiss index of the given type.
+
+        Args:
+            dimensions (int): Dimensionality of the indexed vectors.
+            index_type (str): One of "flat", "hnsw" or "ivfpq".
+
+        Returns:
+            faiss.Index: The empty index. IVF-PQ indexes still need training.
+        """
+        if index_type == "flat":
+            # Exact search using L2 distance metric
+            return faiss.IndexFlatL2(dimensions)
+
+        if index_type == "hnsw":
+            # Graph-based approximate search using L2 distance metric
+            index_faiss = faiss.IndexHNSWFlat(dimensions, settings.HNSW_M)
+            index_faiss.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+            return index_faiss
+
+        if index_type == "ivfpq":
+            # PQ splits every vector into PQ_M sub-vectors of equal length
+            if dimensions % settings.PQ_M != 0:
+                raise ValueError(
+                    f"PQ_M={settings.PQ_M} must divide the {dimensions} indexed "
+                    "dimensions (PCA_DIMENSIONS when PCA is enabled)."
+                )
+
+            # Inverted lists over a coarse quantizer, vectors compressed with PQ
+            quantizer = faiss.IndexFlatL2(dimensions)
+            return faiss.IndexIVFPQ(
+                quantizer,
+                dimensions,
+                settings.IVF_NLIST,
+                settings.PQ_M,
+                settings.PQ_NBITS,
+            )
+
+        raise ValueError(f"Unsupported Faiss index type: {index_type}")
+
+    def train_index(self, index_faiss, features, save=True):
+        """
+        Trains an index on a random sample of the features and optionally saves the
+        trained, still empty, index and its coarse quantizer next to the index,
+        with the PCA reduction the training features went through.
+
+        Args:
+            index_faiss (faiss.Index): The index to train.
+            features (numpy.ndarray): The features to sample training vectors from.
+            save (bool): Whether to save the trained index and quantizer to disk.
+        """
+        rng = np.random.default_rng(0)
+        train_size = min(settings.IVF_TRAIN_SIZE, features.shape[0])
+        sample_ids = np.sort(rng.choice(features.shape[0], train_size, replace=False))
+
+        start_time = time.time()
+        index_faiss.train(np.ascontiguousarray(features[sample_ids], dtype="float32"))
+        LOGGER.info(
+            f"Faiss index trained on {train_size} vectors "
+            f"in {time.time() - start_time:.2f} seconds."
+        )
+
+        if save:
+            faiss.write_index(index_faiss, settings.TRAINED_INDEX_PATH)
+            faiss.write_index(
+                faiss.extract_index_ivf(index_faiss).quantizer, settings.QUANTIZER_PATH
+            )
+            with open(settings.TRAINED_INDEX_META_PATH, "w") as f:
+                json.dump({"reducer": self.reducer_signature()}, f)
+
+    def reducer_signature(self):
+        """
+        Identifies the PCA reduction applied to the indexed features.
+
+        Returns:
+            str: Signature of the reducer, or None if reduction is disabled.
+        """
+        return self.reducer.signature() if self.reducer is not None else None
+
+    def load_trained_index(self, dimensions):
+        """
+        Loads a previously trained, empty index if one matches the configuration
+        and was trained on features reduced by the current PCA projection.
+
+        Args:
+            dimensions (int): Dimensionality of the indexed vectors.
+
+        Returns:
+            faiss.Index: The trained index, or None if there is no usable one.
+        """
+        if not os.path.exists(settings.TRAINED_INDEX_PATH) or not os.path.exists(
+            settings.TRAINED_INDEX_META_PATH
+        ):
+            return None
+
+        index_faiss = faiss.read_index(settings.TRAINED_INDEX_PATH)
+        index_ivf = faiss.downcast_index(faiss.extract_index_ivf(index_faiss))
+        with open(settings.TRAINED_INDEX_META_PATH) as f:
+            meta = json.load(f)
+
+        if (
+            index_faiss.d != dimensions
+            or index_faiss.ntotal != 0
+            or index_ivf.nlist != settings.IVF_NLIST
+            or index_ivf.pq.M != settings.PQ_M
+            or index_ivf.pq.nbits != settings.PQ_NBITS
+            or meta.get("reducer") != self.reducer_signature()
+        ):
+            LOGGER.info("Trained Faiss index does not match the configuration.")
+            return None
+
+        LOGGER.info("Reuse trained Faiss index!")
+        return index_faiss
+
+    @staticmethod
+    def add_features(
+        index_faiss, features, ids=None, chunk_size=settings.INGEST_CHUNK_SIZE
+    ):
+        """
+        Adds features to an index keyed by product id in chunks to bound peak memory.
+
+        Args:
+            index_faiss (faiss.Index): The index to fill, keyed by product id,
+                see with_product_ids.
+            features (numpy.ndarray): The features to add.
+            ids (numpy.ndarray): Product ids of the features, their data.csv rows
+                by default.
+            chunk_size (int): Number of vectors added per call.
+        """
+        if ids is None:
+            ids = np.arange(features.shape[0])
+        ids = np.asarray(ids, dtype=np.int64)
+
+        for start_idx in range(0, features.shape[0], chunk_size):
+            chunk = features[start_idx : start_idx + chunk_size]
+            index_faiss.add_with_ids(
+                np.ascontiguousarray(chunk, dtype="float32"),
+                ids[start_idx : start_idx + chunk_size],
+            )
+
     @time_profiling
     def create_index(self):
         """
         Creates a Faiss index, adds array features to it, and saves the index to disk.
+        For approximate index types, a report comparing the index against an exact
+        flat index is logged.
 
         Returns:
             None
         """
-        # Create an index with FAISS using L2 distance metric
-        index_faiss = faiss.IndexFlatL2(settings.DIMENSIONS)
+        features = self.load_features()
+
+        # Index only the rows with features, keyed by their data.csv row
+        ids = np.flatnonzero(self.load_valid())
+        if len(ids) < features.shape[0]:
+            LOGGER.info(f"Skip {features.shape[0] - len(ids)} rows without features.")
+            features = features[ids]
+
+        start_time = time.time()
+
+        # Create an index with FAISS of the configured type
+        index_faiss = None
+        if settings.INDEX_TYPE == "ivfpq":
+            index_faiss = self.load_trained_index(dimensions=features.shape[1])
+        if index_faiss is None:
+            index_faiss = self.build_index(dimensions=features.shape[1])
+        if not index_faiss.is_trained:
+            self.train_index(index_faiss, features)
+
+        # Key the vectors by product id so they can be updated in place later
+        index_faiss = with_product_ids(index_faiss)
 
         # Add the array features to the Faiss index
-        index_faiss.add(self.image_features["image_features"])
+        self.add_features(index_faiss, features, ids=ids)
+
+        build_time = time.time() - start_time
 
         # Save the index to disk
-        faiss.write_index(index_faiss, settings.INDEX_PATH)
+        write_index_atomic(index_faiss, settings.INDEX_PATH)
 
         # Print a success message
-        LOGGER.info("Faiss index created successfully!")
+        LOGGER.info(
+            f"Faiss {settings.INDEX_TYPE} index created successfully "
+            f"in {build_time:.2f} seconds!"
+        )
+
+        if settings.INDEX_TYPE != "flat":
+            FaissSearch.configure_index(index_faiss)
+            compare_with_flat(index_faiss, build_time, features, ids=ids)
+
+    def update_index(self, delta_path):
+        """
+        Applies a delta file of upserted and deleted products to the saved index,
+        without re-adding the unchanged vectors.
+
+        Args:
+            delta_path (str): Path of the delta npz file, see apply_delta.
+
+        Returns:
+            dict: Number of upserted and deleted products.
+        """
+        with np.load(delta_path) as delta:
+            return update_index_file(delta, reducer=self.reducer)
+
+
+def with_product_ids(index_faiss):
+    """
+    Keys the vectors of a new index by product id, their data.csv row.
+
+    IVF indexes store the ids in their inverted lists and remove entries by id
+    themselves. Wrapping them in an IndexIDMap2 would break removals, since the
+    inverted lists reorder their entries while the id map is compacted in order.
+    Other index types are wrapped in an IndexIDMap2.
+
+    Args:
+        index_faiss (faiss.Index): The empty, trained index.
+
+    Returns:
+        faiss.Index: The index to add features to with ids.
+    """
+    if isinstance(faiss.downcast_index(index_faiss), faiss.IndexIVF):
+        return index_faiss
+
+    return faiss.IndexIDMap2(index_faiss)
+
+
+def product_ids(index_faiss):
+    """
+    Lists the product ids stored in an index keyed by product id.
+
+    Args:
+        index_faiss (faiss.Index): An IndexIDMap2 or an IVF index.
+
+    Returns:
+        numpy.ndarray: The stored product ids.
+    """
+    index_faiss = faiss.downcast_index(index_faiss)
+    if isinstance(index_faiss, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index_faiss.id_map)
+
+    invlists = index_faiss.invlists
+    return np.concatenate(
+        [np.zeros(0, dtype=np.int64)]
+        + [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no))
+            .copy()
+            .astype(np.int64)
+            for list_no in range(invlists.nlist)
+            if invlists.list_size(list_no)
+        ]
+    )
+
+
+def apply_delta(index_faiss, delta, reducer=None):
+    """
+    Upserts and deletes products of an index keyed by product id in place.
+
+    Args:
+        index_faiss (faiss.Index): The index to update, see with_product_ids.
+        delta (Mapping): Arrays "upsert_ids" (U,), "upsert_features"
+            (U, DIMENSIONS) and "delete_ids" (D,). Missing keys are empty. Ids
+            are data.csv rows, so new products must be appended to data.csv.
+        reducer (FeatureReducer): PCA reduction applied to the upserted features,
+            or None.
+
+    Returns:
+        dict: Number of upserted and deleted products.
+    """
+    index_faiss = faiss.downcast_index(index_faiss)
+    if isinstance(index_faiss, faiss.IndexIDMap2):
+        wrapped = faiss.downcast_index(index_faiss.index)
+    elif isinstance(index_faiss, faiss.IndexIVF):
+        wrapped = index_faiss
+    else:
+        raise ValueError(
+            "Faiss index is not keyed by product id, rebuild it with faiss_ingest.py."
+        )
+
+    upsert_ids = np.asarray(delta.get("upsert_ids", []), dtype=np.int64)
+    delete_ids = np.asarray(delta.get("delete_ids", []), dtype=np.int64)
+    upsert_features = np.asarray(
+        delta.get("upsert_features", np.zeros((0, 0))), dtype="float32"
+    )
+
+    if (upsert_ids < 0).any() or (delete_ids < 0).any():
+        raise ValueError("Delta ids must be data.csv rows, not negative.")
+    if len(np.unique(upsert_ids)) != len(upsert_ids):
+        raise ValueError("Delta upsert_ids contains duplicate ids.")
+    if upsert_features.shape[0] != len(upsert_ids):
+        raise ValueError(
+            f"Delta has {len(upsert_ids)} upsert_ids "
+            f"but {upsert_features.shape[0]} upsert_features."
+        )
+
+    if len(upsert_ids):
+        if reducer is not None:
+            upsert_features = reducer.transform(upsert_features)
+        if upsert_features.shape[1] != index_faiss.d:
+            raise ValueError(
+                f"Delta features have {upsert_features.shape[1]} dimensions, "
+                f"the index has {index_faiss.d}."
+            )
+
+    # Updated products are removed first, then added again with the new features
+    existing_ids = product_ids(index_faiss)
+    remove_ids = np.union1d(upsert_ids, delete_ids)
+    remove_ids = remove_ids[np.isin(remove_ids, existing_ids)]
+
+    if len(remove_ids):
+        if isinstance(wrapped, faiss.IndexHNSW):
+            raise ValueError(
+                "Faiss HNSW indexes cannot remove vectors, rebuild the index to "
+                "update or delete products."
+            )
+        if wrapped is not index_faiss and isinstance(wrapped, faiss.IndexIVF):
+            raise ValueError(
+                "Faiss IVF index is wrapped in an id map, which cannot remove "
+                "vectors correctly, rebuild it with faiss_ingest.py."
+            )
+        index_faiss.remove_ids(remove_ids)
+
+    FaissIngest.add_features(index_faiss, upsert_features, ids=upsert_ids)
+
+    return {
+        "upserted": len(upsert_ids),
+        "deleted": int(np.isin(delete_ids, existing_ids).sum()),
+    }
+
+
+def update_index_file(delta, reducer=None, index_path=settings.INDEX_PATH):
+    """
+    Loads the saved index, applies a delta to it and saves it back atomically.
+
+    Args:
+        delta (Mapping): The delta arrays, see apply_delta.
+        reducer (FeatureReducer): PCA reduction applied to the upserted features,
+            or None.
+        index_path (str): Path of the index file.
+
+    Returns:
+        dict: Number of upserted and deleted products.
+    """
+    start_time = time.time()
+
+    index_faiss = faiss.read_index(index_path)
+    counts = apply_delta(index_faiss, delta, reducer=reducer)
+    write_index_atomic(index_faiss, index_path)
+
+    LOGGER.info(
+        f"Faiss index updated with {counts['upserted']} upserts and "
+        f"{counts['deleted']} deletes in {time.time() - start_time:.2f} seconds."
+    )
+    return counts
+
+
+def write_index_atomic(index_faiss, index_path):
+    """
+    Writes an index to a temporary file and renames it over the index path, so
+    readers never see a partially written index.
+
+    Args:
+        index_faiss (faiss.Index): The index to save.
+        index_path (str): Path of the index file.
+    """
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index_faiss, tmp_path)
+
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+
+    # Persist the rename itself
+    dir_fd = os.open(os.path.dirname(os.path.abspath(index_path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+
+class StringColumn:
+    """
+    A column of strings stored as one UTF-8 byte buffer indexed by offsets.
+
+    Attributes:
+        buffer (bytes): Concatenated UTF-8 encoded strings.
+        offsets (np.ndarray): Start offset of every string, followed by the end
+            offset of the last one. (N + 1,)
+    """
+
+    def __init__(self, values):
+        """
+        Initializes a StringColumn from a sequence of strings.
+
+        Args:
+            values (Iterable[str]): The strings to store.
+        """
+        encoded = [value.encode("utf-8") for value in values]
+
+        self.buffer = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + self.offsets.nbytes
+
+    def take(self, indices):
+        """
+        Gathers the strings at the given row indices.
+
+        Args:
+            indices (np.ndarray): Row indices to gather.
+
+        Returns:
+            list: The gathered strings.
+        """
+        starts = self.offsets[indices].tolist()
+        ends = self.offsets[indices + 1].tolist()
+        buffer = self.buffer
+
+        return [buffer[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+
+class PayloadStore:
+    """
+    A compact, array-backed store of product payloads aligned with the index rows.
+
+    Numeric columns are kept as numpy arrays, with sale_rate precomputed, and
+    string columns as StringColumn buffers, so a whole top-k result is hydrated
+    with one gather per column.
+
+    Attributes:
+        item_path (StringColumn): URLs of items in the dataset.
+        item_image (StringColumn): Image paths of items in the dataset.
+        item_name (StringColumn): Names of items in the dataset.
+        fixed_item_price (np.ndarray): Fixed prices of items in the dataset.
+        sale_item_price (np.ndarray): Sale prices of items in the dataset.
+        sale_rate (np.ndarray): Discount rates of items in the dataset.
+        sales_number (np.ndarray): Sales numbers of items in the dataset.
+        shop_path (StringColumn): Paths of shops where items are sold.
+        shop_name (StringColumn): Names of shops where items are sold.
+    """
+
+    STRING_COLUMNS = ("item_path", "item_image", "item_name", "shop_path", "shop_name")
+    INTEGER_COLUMNS = ("fixed_item_price", "sale_item_price", "sales_number")
+    FIELDS = (
+        "item_path",
+        "item_image",
+        "item_name",
+        "fixed_item_price",
+        "sale_item_price",
+        "sale_rate",
+        "sales_number",
+        "shop_path",
+        "shop_name",
+    )
+
+    def __init__(self, data):
+        """
+        Initializes a PayloadStore from a dataset.
+
+        Args:
+            data (pd.DataFrame): The dataset, one row per indexed vector.
+        """
+        for column in self.STRING_COLUMNS:
+            setattr(self, column, StringColumn(data[column].fillna("").astype(str)))
+
+        for column in self.INTEGER_COLUMNS:
+            setattr(self, column, data[column].fillna(0).to_numpy(dtype=np.int64))
+
+        # Precompute the discount rate of every item
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sale_rate = 1 - self.sale_item_price / self.fixed_item_price
+        self.sale_rate = np.where(np.isfinite(sale_rate), sale_rate, 0.0)
+
+        # Rows of every shop, built on the first shop filter
+        self._shop_rows = None
+
+    @classmethod
+    def from_csv(cls, data_path):
+        """
+        Builds a PayloadStore from a CSV file.
+
+        Args:
+            data_path (str): Path of the CSV file.
+
+        Returns:
+            PayloadStore: The payload store.
+        """
+        return cls(pd.read_csv(data_path))
+
+    def __len__(self):
+        return len(self.sale_rate)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in self.FIELDS)
+
+    def gather(self, indices):
+        """
+        Hydrates the payloads of the given rows.
+
+        Args:
+            indices (np.ndarray): Row indices returned by the index. Negative
+                indices, used by Faiss for missing results, and rows not yet in
+                the dataset are skipped.
+
+        Returns:
+            list: A list of dictionaries containing item information.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[(indices >= 0) & (indices < len(self))]
+
+        columns = []
+        for field in self.FIELDS:
+            column = getattr(self, field)
+            if isinstance(column, StringColumn):
+                columns.append(column.take(indices))
+            else:
+                columns.append(column[indices].tolist())
+
+        return [dict(zip(self.FIELDS, row)) for row in zip(*columns)]
+
+    def rows_of_shop(self, shop_path):
+        """
+        Finds the rows of the items sold by a shop.
+
+        Args:
+            shop_path (str): Path of the shop.
+
+        Returns:
+            np.ndarray: Row indices of the shop's items.
+        """
+        if self._shop_rows is None:
+            codes, shops = pd.factorize(
+                pd.Series(self.shop_path.take(np.arange(len(self))))
+            )
+            order = np.argsort(codes, kind="stable")
+            splits = np.cumsum(np.bincount(codes, minlength=len(shops)))[:-1]
+            self._shop_rows = dict(zip(shops, np.split(order, splits)))
+
+        return self._shop_rows.get(shop_path, np.zeros(0, dtype=np.int64))
+
+    def filter_mask(self, filters):
+        """
+        Evaluates search filters on the payload columns.
+
+        Args:
+            filters (SearchFilters): The filters. Unset filters match every row.
+
+        Returns:
+            np.ndarray: Whether each row matches all filters. (N,)
+        """
+        mask = np.ones(len(self), dtype=bool)
+
+        if filters.min_price is not None:
+            mask &= self.sale_item_price >= filters.min_price
+        if filters.max_price is not None:
+            mask &= self.sale_item_price <= filters.max_price
+        if filters.min_sale_rate is not None:
+            mask &= self.sale_rate >= filters.min_sale_rate
+        if filters.max_sale_rate is not None:
+            mask &= self.sale_rate <= filters.max_sale_rate
+        if filters.min_sales_number is not None:
+            mask &= self.sales_number >= filters.min_sales_number
+        if filters.shop_path is not None:
+            shop_mask = np.zeros(len(self), dtype=bool)
+            shop_mask[self.rows_of_shop(filters.shop_path)] = True
+            mask &= shop_mask
+
+        return mask
@@ -1,7 +1,57 @@
+import os
+import threading
+import time
+from datetime import datetime
+
 import faiss
 import numpy as np
-import pandas as pd
 from config import settings
+from src.faiss_search.payload_store import PayloadStore
+from src.feature_extraction.reduction import load_reducer
+from src.utils import LOGGER
+
+
+class IndexSnapshot:
+    """
+    An immutable pairing of a Faiss index with the payloads and the query
+    reduction it was built for.
+
+    Attributes:
+        index (faiss.Index): The Faiss index used for search.
+        payload_store (PayloadStore): Payloads of the items in the dataset.
+        reducer (FeatureReducer): PCA reduction applied to queries, or None.
+        version (int): Sequence number of the snapshot, starting at 1.
+        signature (tuple): Modification time and size of the index, dataset and,
+            when PCA is enabled, reducer files the snapshot was loaded from.
+        loaded_at (float): Time the snapshot was loaded.
+    """
+
+    def __init__(self, index, payload_store, reducer, version, signature):
+        self.index = index
+        self.payload_store = payload_store
+        self.reducer = reducer
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def info(self):
+        """
+        Describes the snapshot.
+
+        Returns:
+        - dict: Version, load time, number of vectors and rows, and the
+          modification times of the source files.
+        """
+        (index_mtime, _), (data_mtime, _) = self.signature[:2]
+
+        return {
+            "version": self.version,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat(),
+            "index_modified_at": datetime.fromtimestamp(index_mtime / 1e9).isoformat(),
+            "data_modified_at": datetime.fromtimestamp(data_mtime / 1e9).isoformat(),
+            "num_vectors": self.index.ntotal,
+            "num_rows": len(self.payload_store),
+        }
 
 
 class FaissSearch:
@@ -9,17 +59,12 @@ class FaissSearch:
     A class for performing similarity search using the Faiss library.
 
     This class provides functionality to perform similarity search using a pre-built Faiss index.
+    The index, its payloads and the query reduction are held in an IndexSnapshot
+    that is replaced as a whole on reload, so searches already running finish on
+    the snapshot they started with.
 
     Attributes:
-        index (faiss.Index): The Faiss index used for search.
-        item_path (np.ndarray): URLs of items in the dataset.
-        item_image (np.ndarray): Image paths of items in the dataset.
-        item_name (np.ndarray): Names of items in the dataset.
-        fixed_item_price (np.ndarray): Fixed prices of items in the dataset.
-        sale_item_price (np.ndarray): Sale prices of items in the dataset.
-        sales_number (np.ndarray): Sales numbers of items in the dataset.
-        shop_path (np.ndarray): Paths of shops where items are sold.
-        shop_name (np.ndarray): Names of shops where items are sold.
+        snapshot (IndexSnapshot): The index and payloads currently searched.
     """
 
     def __init__(self):
@@ -28,55 +73,260 @@ class FaissSearch:
 
         This class provides functionality to perform similarity search using the Faiss library.
         """
-        # Load the dataset
-        data = pd.read_csv(settings.DATA_PATH)
+        self.snapshot = None
+        self._reload_lock = threading.Lock()
+        self.load()
+
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @property
+    def payload_store(self):
+        return self.snapshot.payload_store
+
+    @property
+    def reducer(self):
+        return self.snapshot.reducer
+
+    @staticmethod
+    def file_signature():
+        """
+        Returns the modification time and size of the index and dataset files,
+        and of the reducer file when PCA is enabled.
+
+        Returns:
+        - tuple: (st_mtime_ns, st_size) of the index file, of the dataset file and
+          of the reducer file if any.
+        """
+        paths = (settings.INDEX_PATH, settings.DATA_PATH)
+        if settings.PCA_ENABLED:
+            paths += (settings.PCA_PATH,)
+
+        return tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths))
+
+    def load(self):
+        """
+        Loads, or reloads after an update, the dataset, the Faiss index and the
+        PCA reduction, if enabled, into a new snapshot, then swaps it in.
+
+        Returns:
+        - IndexSnapshot: The new snapshot.
+        """
+        with self._reload_lock:
+            start_time = time.time()
+            signature = self.file_signature()
+
+            # Load the dataset
+            payload_store = PayloadStore.from_csv(settings.DATA_PATH)
+
+            # Read the Faiss index
+            index = self.read_index(settings.INDEX_PATH)
+            self.configure_index(index)
 
-        # Read the Faiss index
-        self.index = faiss.read_index(settings.INDEX_PATH)
+            # Load the PCA reduction the index was built with
+            reducer = load_reducer()
+            if reducer is not None and reducer.output_dim != index.d:
+                raise ValueError(
+                    f"PCA reduces queries to {reducer.output_dim} dimensions, the "
+                    f"Faiss index has {index.d}."
+                )
 
-        # Extract attributes from the dataset
-        self.item_path = data["item_path"]
-        self.item_image = data["item_image"]
-        self.item_name = data["item_name"]
-        self.fixed_item_price = data["fixed_item_price"]
-        self.sale_item_price = data["sale_item_price"]
-        self.sales_number = data["sales_number"]
-        self.shop_path = data["shop_path"]
-        self.shop_name = data["shop_name"]
+            version = self.snapshot.version + 1 if self.snapshot is not None else 1
+            snapshot = IndexSnapshot(index, payload_store, reducer, version, signature)
+
+            # A single reference assignment, readers see either snapshot whole
+            self.snapshot = snapshot
+
+        LOGGER.info(
+            f"Faiss index version {version} loaded with {index.ntotal} vectors "
+            f"in {time.time() - start_time:.2f} seconds."
+        )
+        return snapshot
+
+    def reload_if_changed(self):
+        """
+        Reloads the snapshot if the index or dataset file changed since it was
+        loaded. A failed reload keeps the current snapshot.
+
+        Returns:
+        - bool: Whether a new snapshot was loaded.
+        """
+        try:
+            if self.file_signature() == self.snapshot.signature:
+                return False
+
+            self.load()
+            return True
+
+        except Exception as e:
+            LOGGER.error(f"Could not reload Faiss index: {e}")
+            return False
+
+    @staticmethod
+    def read_index(index_path, index_type=settings.INDEX_TYPE):
+        """
+        Reads a Faiss index from disk, memory-mapping it when settings.INDEX_MMAP is
+        enabled and the index type supports it. Memory-mapped indexes are served
+        from the shared page cache, so every worker process uses the same copy.
+
+        Args:
+        - index_path (str): Path of the index file.
+        - index_type (str): Type of the index, one of "flat", "hnsw" or "ivfpq".
+
+        Returns:
+        - faiss.Index: The loaded index.
+        """
+        if not settings.INDEX_MMAP:
+            return faiss.read_index(index_path)
+
+        if index_type == "ivfpq":
+            # Inverted lists are mapped as read-only on-disk lists
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        elif hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            # Flat codes (also the HNSW storage) are mapped in place
+            io_flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        else:
+            LOGGER.warning(
+                f"Faiss {faiss.__version__} cannot memory-map {index_type} indexes, "
+                "loading into process memory."
+            )
+            return faiss.read_index(index_path)
+
+        if settings.INDEX_PREWARM:
+            prewarm_file(index_path)
+
+        LOGGER.info(f"Memory-map Faiss {index_type} index from {index_path}")
+        return faiss.read_index(index_path, io_flags)
+
+    @staticmethod
+    def configure_index(index):
+        """
+        Applies the configured search-time parameters to an index.
+
+        Args:
+        - index (faiss.Index): The Faiss index used for search.
+        """
+        index_type = faiss.downcast_index(index)
+
+        # Look through the product id mapping at the wrapped index
+        if isinstance(index_type, faiss.IndexIDMap):
+            index_type = faiss.downcast_index(index_type.index)
+
+        if isinstance(index_type, faiss.IndexHNSW):
+            faiss.ParameterSpace().set_index_parameter(
+                index, "efSearch", settings.HNSW_EF_SEARCH
+            )
+        elif isinstance(index_type, faiss.IndexIVF):
+            faiss.ParameterSpace().set_index_parameter(
+                index, "nprobe", settings.IVF_NPROBE
+            )
+
+    @staticmethod
+    def search_parameters(index, mask):
+        """
+        Builds search parameters that restrict an index to the rows of a mask, with
+        the configured search-time parameters of the index type.
+
+        Args:
+        - index (faiss.Index): The Faiss index used for search.
+        - mask (np.ndarray): Whether each product id may be returned. (N,)
+
+        Returns:
+        - tuple: The faiss.SearchParameters and the bitmap they point to, which
+          must be kept alive until the search returns.
+        """
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+        index_type = faiss.downcast_index(index)
+        if isinstance(index_type, faiss.IndexIDMap):
+            index_type = faiss.downcast_index(index_type.index)
+
+        if isinstance(index_type, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(
+                sel=selector, efSearch=settings.HNSW_EF_SEARCH
+            )
+        elif isinstance(index_type, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=settings.IVF_NPROBE)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+
+        return params, bitmap
 
     # @time_profiling
-    def search(self, query_vector, top_k=settings.TOP_K):
+    def search(self, query_vector, top_k=settings.TOP_K, filters=None):
         """
         Performs a similarity search using the provided query vector.
 
         Args:
         - query_vector (np.ndarray): The query vector for similarity search.
         - top_k (int, optional): The number of nearest neighbors to retrieve.
+        - filters (SearchFilters, optional): Payload filters applied during search.
 
         Returns:
         - list: A list of dictionaries containing search results, including item information.
         """
-        distances, indices = self.index.search(query_vector, top_k)
-
-        results = []
-
-        for idx in indices[0]:
-            sale_rate = 1 - (self.sale_item_price[idx] / self.fixed_item_price[idx])
-            results.append(
-                {
-                    "item_path": self.item_path[idx],
-                    "item_image": self.item_image[idx],
-                    "item_name": self.item_name[idx],
-                    "fixed_item_price": self.fixed_item_price[idx],
-                    "sale_item_price": self.sale_item_price[idx],
-                    "sale_rate": sale_rate,
-                    "sales_number": self.sales_number[idx],
-                    "shop_path": self.shop_path[idx],
-                    "shop_name": self.shop_name[idx],
-                }
+        return self.search_batch(
+            query_vectors=query_vector[:1], top_k=top_k, filters=filters
+        )[0]
+
+    def search_batch(self, query_vectors, top_k=settings.TOP_K, filters=None):
+        """
+        Performs a similarity search for several query vectors in one index call.
+        Filters restrict the index search itself, so every page is filled with
+        matching items when enough of them exist.
+
+        Args:
+        - query_vectors (np.ndarray): The query vectors for similarity search. (N, D)
+        - top_k (int, optional): The number of nearest neighbors to retrieve.
+        - filters (SearchFilters, optional): Payload filters applied during search.
+
+        Returns:
+        - list: One list of result dictionaries per query vector, in input order.
+        """
+        # Keep using this snapshot even if a reload swaps in a new one
+        snapshot = self.snapshot
+
+        if snapshot.reducer is not None:
+            query_vectors = snapshot.reducer.transform(query_vectors)
+
+        if filters is None or filters.is_empty():
+            distances, indices = snapshot.index.search(query_vectors, top_k)
+        else:
+            params, bitmap = self.search_parameters(
+                snapshot.index, snapshot.payload_store.filter_mask(filters)
+            )
+            distances, indices = snapshot.index.search(
+                query_vectors, top_k, params=params
             )
 
-        return results
+        return [snapshot.payload_store.gather(row) for row in indices]
+
+
+def prewarm_file(file_path, chunk_size=16 * 1024 * 1024):
+    """
+    Reads a file sequentially so that its pages are in the page cache before the
+    first queries touch a memory-mapped index.
+
+    Args:
+    - file_path (str): Path of the file to pre-warm.
+    - chunk_size (int): Number of bytes read per call.
+    """
+    start_time = time.time()
+
+    with open(file_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+        buffer = bytearray(chunk_size)
+        while f.readinto(buffer):
+            pass
+
+    LOGGER.info(
+        f"Pre-warmed {file_path} ({os.path.getsize(file_path) / 2**20:.1f} MiB) "
+        f"in {time.time() - start_time:.2f} seconds."
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+import asyncio
+import contextlib
+import time
+
+import torch
+from config import settings
+from src.feature_extraction.preprocessing import BufferPool
+from src.utils import LOGGER
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-image inference requests into batched calls.
+
+    Callers submit preprocessed image tensors and await their own feature row.
+    A background task drains the queue, waiting at most ``max_wait_ms`` after the
+    first request for up to ``max_batch_size`` requests, stacks them and makes a
+    single call to ``infer_fn``. Up to ``max_in_flight`` batches run concurrently,
+    while all of them are busy new requests keep filling the next batch.
+
+    Attributes:
+        name (str): Name used in logs and statistics.
+        infer_fn (Callable): Coroutine function taking a stacked tensor
+            [N, 3, 300, 300] and returning a numpy array [N, DIMENSIONS].
+        max_batch_size (int): Maximum number of images per batch.
+        max_wait (float): Maximum time in seconds to wait for a batch to fill.
+        max_in_flight (int): Maximum number of batches dispatched concurrently.
+    """
+
+    def __init__(
+        self,
+        name,
+        infer_fn,
+        max_batch_size=settings.BATCH_MAX_SIZE,
+        max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+        max_in_flight=settings.BATCH_MAX_IN_FLIGHT,
+    ):
+        """
+        Initializes the MicroBatcher.
+
+        Args:
+        - name (str): Name used in logs and statistics.
+        - infer_fn (Callable): Coroutine function performing batched inference.
+        - max_batch_size (int): Maximum number of images per batch.
+        - max_wait_ms (float): Maximum wait in milliseconds for a batch to fill.
+        - max_in_flight (int): Maximum number of batches dispatched concurrently.
+        """
+        self.name = name
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._queue = None
+        self._worker = None
+        self._in_flight = None
+        self._batch_tasks = set()
+
+        # One reusable batch tensor per in-flight batch
+        self._buffers = BufferPool(self.max_batch_size, self.max_in_flight)
+
+        # Batch statistics
+        self.num_batches = 0
+        self.num_items = 0
+        self.fill_histogram = [0] * self.max_batch_size
+
+    def _ensure_started(self):
+        """
+        Starts the background batching task on the running event loop.
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, image):
+        """
+        Submits a preprocessed image and waits for its extracted features.
+
+        Args:
+        - image (torch.Tensor): Preprocessed image tensor. [1, 3, 300, 300]
+
+        Returns:
+        - numpy.ndarray: Extracted features for this image. (1, DIMENSIONS)
+        """
+        self._ensure_started()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+
+        return await future
+
+    async def _collect(self):
+        """
+        Waits for the first request, then collects more until the batch is full
+        or the maximum wait time has elapsed.
+
+        Returns:
+        - list: A list of (image, future) tuples.
+        """
+        items = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    async def _run(self):
+        """
+        Background loop that forms batches and dispatches them to ``infer_fn``
+        without waiting for the previous batches to finish.
+        """
+        in_flight = self._in_flight
+
+        while True:
+            # Wait for a free slot first, requests keep queueing meanwhile
+            await in_flight.acquire()
+
+            try:
+                items = await self._collect()
+            except BaseException:
+                in_flight.release()
+                raise
+
+            # Skip requests whose callers have gone away
+            items = [(image, future) for image, future in items if not future.done()]
+            if not items:
+                in_flight.release()
+                continue
+
+            self._record(len(items))
+
+            task = asyncio.create_task(self._dispatch(items, in_flight))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _dispatch(self, items, in_flight):
+        """
+        Runs one batch through ``infer_fn`` and resolves the futures of its
+        requests.
+
+        Args:
+        - items (list): A list of (image, future) tuples.
+        - in_flight (asyncio.Semaphore): The slot held by this batch.
+        """
+        try:
+            # infer_fn is done with the batch tensor once it returns
+            with self._buffers.batch(len(items)) as batch:
+                torch.cat([image for image, _ in items], dim=0, out=batch)
+                features = await self.infer_fn(batch)
+        except Exception as e:
+            LOGGER.error(f"Batch inference failed in {self.name} batcher: {e}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            in_flight.release()
+
+        for row, (_, future) in enumerate(items):
+            if not future.done():
+                future.set_result(features[row : row + 1])
+
+    def _record(self, batch_size):
+        """
+        Records how full a dispatched batch was.
+
+        Args:
+        - batch_size (int): Number of images in the batch.
+        """
+        self.num_batches += 1
+        self.num_items += batch_size
+        self.fill_histogram[batch_size - 1] += 1
+
+        LOGGER.debug(
+            f"{self.name} batcher dispatched batch of {batch_size}/{self.max_batch_size}"
+        )
+
+    def stats(self):
+        """
+        Returns batch fill statistics.
+
+        Returns:
+        - dict: Number of batches, average batch size and fill ratio, and a
+          histogram of batch sizes.
+        """
+        avg_batch_size = self.num_items / self.num_batches if self.num_batches else 0.0
+
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": len(self._batch_tasks),
+            "num_batches": self.num_batches,
+            "num_items": self.num_items,
+            "avg_batch_size": avg_batch_size,
+            "avg_fill_ratio": avg_batch_size / self.max_batch_size,
+            "batch_size_histogram": {
+                str(size + 1): count
+                for size, count in enumerate(self.fill_histogram)
+                if count
+            },
+        }
+
+    async def close(self):
+        """
+        Stops the background batching task and the batches still running.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+
+        for task in list(self._batch_tasks):
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
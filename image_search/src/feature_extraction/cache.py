@@ -0,0 +1,188 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+from config import settings
+from src.utils import LOGGER
+
+
+class EmbeddingCache:
+    """
+    A content-addressed cache of extracted query features.
+
+    Features are keyed by a hash of the uploaded bytes, so a popular image is
+    decoded, preprocessed and run through the model only once. The first level
+    is an in-process LRU with TTL expiry. An optional second level in Redis is
+    shared by every replica of the service.
+
+    Attributes:
+        max_entries (int): Maximum number of entries in the in-process cache.
+        ttl (float): Time to live of an entry in seconds.
+        dtype (numpy.dtype): Storage type of the cached features.
+        dimensions (int): Length of the cached features.
+        redis (redis.asyncio.Redis): Client of the shared cache, or None.
+    """
+
+    def __init__(
+        self,
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        ttl=settings.CACHE_TTL_SECONDS,
+        float16=settings.CACHE_FLOAT16,
+        redis_url=settings.CACHE_REDIS_URL,
+        redis_timeout=settings.CACHE_REDIS_TIMEOUT_SECONDS,
+        dimensions=settings.DIMENSIONS,
+    ):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+        - max_entries (int): Maximum number of entries in the in-process cache.
+        - ttl (float): Time to live of an entry in seconds.
+        - float16 (bool): Whether to store features as float16 to halve memory.
+        - redis_url (str): URL of the shared Redis cache, empty to disable it.
+        - redis_timeout (float): Connect and read timeout of Redis in seconds, so
+          an outage degrades to cache misses instead of stalling requests.
+        - dimensions (int): Length of the cached features.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dtype = np.float16 if float16 else np.float32
+        self.dimensions = dimensions
+
+        self._entries = OrderedDict()
+
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis
+
+            self.redis = redis.from_url(
+                redis_url,
+                socket_timeout=redis_timeout,
+                socket_connect_timeout=redis_timeout,
+            )
+
+        # Cache statistics
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, contents, namespace):
+        """
+        Computes the cache key of an uploaded image.
+
+        Args:
+        - contents (bytes): The raw contents of the uploaded image.
+        - namespace (str): Identity of the backend and model producing the
+          features, so that different backends and models do not share entries.
+
+        Returns:
+        - str: The cache key, which also holds the storage type of the features.
+        """
+        digest = hashlib.blake2b(contents, digest_size=16).hexdigest()
+        dtype = np.dtype(self.dtype).name
+
+        return f"image_search:feature:{namespace}:{dtype}:{digest}"
+
+    async def get(self, key):
+        """
+        Looks up the features of an image.
+
+        Args:
+        - key (str): The cache key.
+
+        Returns:
+        - numpy.ndarray: The cached features (1, DIMENSIONS), or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, feature = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return feature.astype(np.float32).reshape(1, -1)
+
+            del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(key)
+            except Exception as e:
+                LOGGER.error(f"Could not read shared embedding cache: {e}")
+                value = None
+
+            # Ignore entries of another length, e.g. written by another version
+            expected_size = self.dimensions * np.dtype(self.dtype).itemsize
+            if value is not None and len(value) != expected_size:
+                LOGGER.error(
+                    f"Shared embedding cache entry has {len(value)} bytes, "
+                    f"expected {expected_size}."
+                )
+                value = None
+
+            if value is not None:
+                feature = np.frombuffer(value, dtype=self.dtype)
+                self._store(key, feature)
+                self.redis_hits += 1
+                return feature.astype(np.float32).reshape(1, -1)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, feature):
+        """
+        Stores the features of an image.
+
+        Args:
+        - key (str): The cache key.
+        - feature (numpy.ndarray): The extracted features. (1, DIMENSIONS)
+        """
+        feature = np.ascontiguousarray(feature, dtype=self.dtype).reshape(-1)
+        self._store(key, feature)
+
+        if self.redis is not None:
+            try:
+                await self.redis.set(
+                    key, feature.tobytes(), px=max(int(self.ttl * 1000), 1)
+                )
+            except Exception as e:
+                LOGGER.error(f"Could not write shared embedding cache: {e}")
+
+    def _store(self, key, feature):
+        """
+        Inserts an entry in the in-process cache, evicting the least recently used
+        entries beyond the size bound.
+        """
+        self._entries[key] = (time.monotonic() + self.ttl, feature)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+        - dict: Size of the cache, hits, misses and evictions.
+        """
+        lookups = self.hits + self.redis_hits + self.misses
+
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
+
+    async def close(self):
+        """
+        Closes the connection to the shared cache.
+        """
+        if self.redis is not None:
+            await self.redis.close()
@@ -1,7 +1,14 @@
+import os
+
+import numpy as np
 import torch
 import tritonclient.grpc.aio as grpcclient
 from config import settings
-from src.utils import LOGGER, decode_img
+from src.feature_extraction.onnx_backend import OnnxRuntimeModel
+from src.feature_extraction.preprocessing import Preprocessor
+from src.feature_extraction.triton_pool import TritonClientPool
+from src.feature_extraction.triton_shm import TritonSharedMemoryPool
+from src.utils import LOGGER, decode_image_bytes, decode_img, open_image_header
 from torchvision.io import read_image
 from torchvision.models import EfficientNet_B3_Weights, efficientnet_b3
 
@@ -16,23 +23,43 @@ class FeatureExtractor:
         Attributes:
         - device (torch.device): Represents the device (CPU/GPU) where the model will be loaded.
         - weights (EfficientNet_B3_Weights): Specifies the pre-trained weights to be used.
-        - model (torch.nn.Module): The loaded EfficientNet-B3 model.
+        - preprocessor (Preprocessor): The inference transforms of the weights.
+        - backend (str): The local inference backend, "torch", "onnxruntime" or
+          "onnxruntime_int8".
+        - model (torch.nn.Module | OnnxRuntimeModel): The loaded EfficientNet-B3 model.
+        - model_id (str): Identity of the backend and model, part of the cache keys
+          of the extracted features.
+        - triton_pool (TritonClientPool): Pool of Triton gRPC channels.
+        - triton_shm (TritonSharedMemoryPool): Shared-memory transport for Triton
+          tensors, or None to send them in the gRPC messages.
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         LOGGER.info(f"Model run on {self.device} device")
         self.weights = EfficientNet_B3_Weights.IMAGENET1K_V1
+        self.preprocessor = Preprocessor()
+        self.backend = settings.INFERENCE_BACKEND
         self.model = self.load_model()
-        self.triton_client = grpcclient.InferenceServerClient(
-            url=settings.TRITON_SERVER_URL
+        self.model_id = self.identify_model()
+        self.triton_pool = TritonClientPool()
+        self.triton_shm = (
+            TritonSharedMemoryPool(self.triton_pool)
+            if settings.TRITON_SHM_ENABLED
+            else None
         )
 
     def load_model(self):
         """
-        Loads the pre-trained EfficientNet-B3 model.
+        Loads the pre-trained EfficientNet-B3 model for the configured backend.
 
         Returns:
-        - torch.nn.Module: The loaded model.
+        - torch.nn.Module | OnnxRuntimeModel: The loaded model.
         """
+        if self.backend == "onnxruntime":
+            return OnnxRuntimeModel(model_path=settings.ONNX_MODEL_PATH)
+
+        if self.backend == "onnxruntime_int8":
+            return OnnxRuntimeModel(model_path=settings.ONNX_INT8_MODEL_PATH)
+
         # Load the pre-trained model
         model = efficientnet_b3(weights=self.weights)
 
@@ -44,6 +71,29 @@ class FeatureExtractor:
 
         return model
 
+    def identify_model(self):
+        """
+        Identifies the local backend and model, down to the exported model file,
+        so that features of another model are never taken from a shared cache.
+
+        Returns:
+        - str: The model identity.
+        """
+        if self.backend == "torch":
+            return f"torch:{self.weights.name}"
+
+        model_path = (
+            settings.ONNX_INT8_MODEL_PATH
+            if self.backend == "onnxruntime_int8"
+            else settings.ONNX_MODEL_PATH
+        )
+        stat = os.stat(model_path)
+
+        return (
+            f"{self.backend}:{os.path.basename(model_path)}:"
+            f"{stat.st_size}:{int(stat.st_mtime)}"
+        )
+
     def preprocess_input(self, image_path):
         """
         Preprocesses the input image for inference.
@@ -56,14 +106,47 @@ class FeatureExtractor:
         """
         image = read_image(image_path)
 
-        # Initialize the inference transforms
-        preprocess = self.weights.transforms(antialias=True)
-
         # Process RGBA image
         image = image.narrow(0, 0, 3)
 
         # Apply inference preprocessing transforms
-        image = preprocess(image).unsqueeze(0)
+        image = self.preprocessor(image)
+
+        return image
+
+    def preprocess_bytes(self, contents, out=None):
+        """
+        Preprocesses an encoded image held in memory for inference.
+
+        Args:
+        - contents (bytes): The encoded image data.
+        - out (torch.Tensor, optional): Buffer receiving the result, e.g. a row
+          of a preallocated batch. [3, 300, 300]
+
+        Returns:
+        - torch.Tensor: Preprocessed image tensor. [1, 3, 300, 300], or ``out``.
+        """
+        image = decode_image_bytes(contents, min_size=self.preprocessor.resize_size)
+
+        # Apply inference preprocessing transforms
+        image = self.preprocessor(image, out=out)
+
+        return image
+
+    def preprocess_base64(self, image):
+        """
+        Preprocesses a base64-encoded image for inference.
+
+        Args:
+        - image (str): Base64-encoded image data.
+
+        Returns:
+        - torch.Tensor: Preprocessed image tensor. [1, 3, 300, 300]
+        """
+        image = decode_img(image, min_size=self.preprocessor.resize_size)
+
+        # Apply inference preprocessing transforms
+        image = self.preprocessor(image)
 
         return image
 
@@ -81,20 +164,36 @@ class FeatureExtractor:
         """
         image = self.preprocess_input(image_path)
 
-        feature = self.model(image.to(self.device))
-
-        feature = feature.cpu().detach().numpy()
+        feature = self.extract_batch(image)
 
         return feature
 
+    def extract_batch(self, images):
+        """
+        Extracts features from a batch of preprocessed images in one forward pass.
+
+        Args:
+        - images (torch.Tensor): Stacked preprocessed images. [N, 3, 300, 300]
+
+        Returns:
+        - numpy.ndarray: Extracted features as a numpy array. (N, 1000)
+        """
+        if self.backend != "torch":
+            return self.model(images.numpy())
+
+        with torch.inference_mode():
+            features = self.model(images.to(self.device))
+
+        return features.cpu().numpy()
+
     # @async_py_profiling
     # @async_time_profiling
     async def triton_inference(self, image, model_name, inputs_name, outputs_name):
         """
-        Perform Triton inference on an input image.
+        Perform Triton inference on an input image or a batch of images.
 
         Args:
-        - image (torch.Tensor): Preprocessed image tensor.
+        - image (torch.Tensor): Preprocessed image tensor. [N, 3, 300, 300]
         - model_name (str): Name of the Triton model.
         - inputs_name (str): Name of the input tensor.
         - outputs_name (str): Name of the output tensor.
@@ -102,12 +201,23 @@ class FeatureExtractor:
         Returns:
         - numpy.ndarray: Extracted features as a numpy array.
         """
+        if (
+            self.triton_shm is not None
+            and image.shape[0] <= self.triton_shm.max_batch_size
+        ):
+            return await self.triton_shm.infer(
+                image,
+                model_name=model_name,
+                inputs_name=inputs_name,
+                outputs_name=outputs_name,
+            )
+
         inputs = [grpcclient.InferInput(inputs_name, image.shape, datatype="FP32")]
         outputs = [grpcclient.InferRequestedOutput(outputs_name)]
 
         inputs[0].set_data_from_numpy(image.numpy())
 
-        results = await self.triton_client.infer(
+        results = await self.triton_pool.infer(
             model_name=model_name, inputs=inputs, outputs=outputs
         )
 
@@ -150,13 +260,7 @@ class FeatureExtractor:
         Returns:
         - numpy.ndarray: Extracted features as a numpy array.
         """
-        image = decode_img(image)
-
-        # Initialize the inference transforms
-        preprocess = self.weights.transforms(antialias=True)
-
-        # Apply inference preprocessing transforms
-        image = preprocess(image).unsqueeze(0)
+        image = self.preprocess_base64(image)
 
         feature = await self.triton_inference(
             image=image,
@@ -166,3 +270,52 @@ class FeatureExtractor:
         )
 
         return feature
+
+    async def triton_extract_bytes(self, contents, model_name=None):
+        """
+        Extracts features from an encoded image (JPEG, PNG) with a Triton ensemble
+        that decodes and preprocesses it server-side, so only the compressed image
+        is sent.
+
+        Args:
+        - contents (bytes): The encoded image data.
+        - model_name (str): Name of the Triton ensemble model.
+
+        Returns:
+        - numpy.ndarray: Extracted features as a numpy array. (1, DIMENSIONS)
+
+        Raises:
+        - ImageTooLargeError: If the image exceeds the upload limits.
+        - InvalidImageError: If the data is not a supported image.
+        """
+        # Triton decodes the image, so the limits are checked on its header here
+        open_image_header(contents)
+
+        image = np.array([[contents]], dtype=np.object_)
+
+        inputs = [
+            grpcclient.InferInput(
+                settings.ENSEMBLE_INPUT_NAME, image.shape, datatype="BYTES"
+            )
+        ]
+        outputs = [grpcclient.InferRequestedOutput(settings.MODEL_OUTPUT_NAME)]
+
+        inputs[0].set_data_from_numpy(image)
+
+        results = await self.triton_pool.infer(
+            model_name=model_name or settings.ENSEMBLE_MODEL_NAME,
+            inputs=inputs,
+            outputs=outputs,
+        )
+
+        feature = results.as_numpy(settings.MODEL_OUTPUT_NAME)
+
+        return feature
+
+    async def close(self):
+        """
+        Releases the Triton shared-memory regions, if any, and the Triton channels.
+        """
+        if self.triton_shm is not None:
+            await self.triton_shm.close()
+        await self.triton_pool.close()
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+import onnxruntime as ort
+from config import settings
+from src.utils import LOGGER
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+class OnnxRuntimeModel:
+    """
+    An in-process ONNX Runtime CPU session for the exported EfficientNet-B3 model.
+
+    Attributes:
+        session (onnxruntime.InferenceSession): The inference session.
+        input_name (str): Name of the model input.
+        output_name (str): Name of the model output.
+    """
+
+    def __init__(
+        self,
+        model_path=settings.ONNX_MODEL_PATH,
+        intra_op_threads=settings.ORT_INTRA_OP_THREADS,
+        inter_op_threads=settings.ORT_INTER_OP_THREADS,
+        graph_optimization=settings.ORT_GRAPH_OPTIMIZATION,
+        warmup_runs=settings.ORT_WARMUP_RUNS,
+    ):
+        """
+        Creates and warms up the inference session.
+
+        Args:
+        - model_path (str): Path of the ONNX model.
+        - intra_op_threads (int): Threads used inside an operator, 0 for default.
+        - inter_op_threads (int): Threads used across operators, 0 for default.
+        - graph_optimization (str): One of "disabled", "basic", "extended", "all".
+        - warmup_runs (int): Number of inference runs made before serving.
+        """
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization]
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+        LOGGER.info(f"Loaded ONNX Runtime model from {model_path}")
+
+        self.warmup(warmup_runs)
+
+    def warmup(self, runs):
+        """
+        Runs inference on a dummy input so that the first request does not pay for
+        memory allocation and kernel selection.
+
+        Args:
+        - runs (int): Number of warm-up runs.
+        """
+        if runs <= 0:
+            return
+
+        dummy = np.zeros((1, 3, 300, 300), dtype=np.float32)
+
+        start_time = time.time()
+        for _ in range(runs):
+            self(dummy)
+
+        LOGGER.info(
+            f"ONNX Runtime session warmed up in {time.time() - start_time:.4f} seconds."
+        )
+
+    def __call__(self, images):
+        """
+        Runs inference on a batch of preprocessed images.
+
+        Args:
+        - images (numpy.ndarray): Preprocessed images. (N, 3, 300, 300)
+
+        Returns:
+        - numpy.ndarray: Extracted features. (N, 1000)
+        """
+        return self.session.run(
+            [self.output_name], {self.input_name: np.ascontiguousarray(images)}
+        )[0]
@@ -0,0 +1,143 @@
+import contextlib
+
+import torch
+from torchvision.transforms import InterpolationMode
+from torchvision.transforms import functional as F
+
+# ImageNet statistics used by the EfficientNet-B3 weights
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class Preprocessor:
+    """
+    The EfficientNet-B3 inference transforms, built once and shared by all requests.
+
+    Produces the same output as ``EfficientNet_B3_Weights.IMAGENET1K_V1.transforms``
+    with fewer intermediate tensors: the image is resized and center-cropped in its
+    input dtype (uint8 for decoded images), the crop is a view, and the dtype
+    conversion and normalization are fused into one ``addcmul`` that can write
+    into a caller-provided buffer.
+
+    Attributes:
+        resize_size (int): Size of the shorter side after resizing.
+        crop_size (int): Size of the square center crop.
+        interpolation (InterpolationMode): Resize interpolation.
+    """
+
+    def __init__(
+        self,
+        resize_size=320,
+        crop_size=300,
+        mean=IMAGENET_MEAN,
+        std=IMAGENET_STD,
+        interpolation=InterpolationMode.BICUBIC,
+    ):
+        """
+        Initializes the Preprocessor.
+
+        Args:
+        - resize_size (int): Size of the shorter side after resizing.
+        - crop_size (int): Size of the square center crop.
+        - mean (tuple): Per-channel mean of the normalization.
+        - std (tuple): Per-channel standard deviation of the normalization.
+        - interpolation (InterpolationMode): Resize interpolation.
+        """
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        self.interpolation = interpolation
+
+        # (x / 255 - mean) / std == x * scale + bias, per channel
+        mean = torch.tensor(mean, dtype=torch.float32).view(3, 1, 1)
+        std = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        self.bias = -mean / std
+        self.scale_uint8 = 1 / (255 * std)
+        self.scale_float = 1 / std
+
+    def __call__(self, image, out=None):
+        """
+        Preprocesses a decoded image.
+
+        Args:
+        - image (torch.Tensor): RGB image, uint8 in [0, 255] or float in [0, 1].
+          [3, H, W]
+        - out (torch.Tensor, optional): Buffer receiving the result, e.g. a row
+          of a preallocated batch. [3, 300, 300]
+
+        Returns:
+        - torch.Tensor: Preprocessed image tensor. [1, 3, 300, 300], or ``out``.
+        """
+        image = F.resize(
+            image, [self.resize_size], interpolation=self.interpolation, antialias=True
+        )
+        image = F.center_crop(image, [self.crop_size])
+
+        scale = self.scale_uint8 if image.dtype == torch.uint8 else self.scale_float
+
+        if out is None:
+            out = torch.empty(1, 3, self.crop_size, self.crop_size, dtype=torch.float32)
+
+        torch.addcmul(self.bias, image, scale, out=out.view_as(image))
+
+        return out
+
+
+class BufferPool:
+    """
+    Reusable preallocated batch buffers of preprocessed images.
+
+    A buffer is taken for one batch and given back once inference has consumed
+    it, so steady traffic runs on the same few tensors instead of allocating a
+    new batch per request. A batch that fails drops its buffer. Up to
+    ``num_buffers`` buffers are kept, batches beyond them or larger than
+    ``max_batch_size`` get a temporary tensor.
+
+    Attributes:
+        max_batch_size (int): Number of images a pooled buffer holds.
+        num_buffers (int): Number of buffers kept for reuse.
+        image_shape (tuple): Shape of one preprocessed image.
+    """
+
+    def __init__(self, max_batch_size, num_buffers, image_shape=(3, 300, 300)):
+        """
+        Initializes the BufferPool. Buffers are allocated on first use.
+
+        Args:
+        - max_batch_size (int): Number of images a pooled buffer holds.
+        - num_buffers (int): Number of buffers kept for reuse.
+        - image_shape (tuple): Shape of one preprocessed image.
+        """
+        self.max_batch_size = max_batch_size
+        self.num_buffers = max(1, num_buffers)
+        self.image_shape = tuple(image_shape)
+
+        self._free = []
+
+    @contextlib.contextmanager
+    def batch(self, batch_size):
+        """
+        Lends a buffer for one batch.
+
+        Args:
+        - batch_size (int): Number of images in the batch.
+
+        Yields:
+        - torch.Tensor: A view of a pooled buffer. [batch_size, 3, 300, 300]
+        """
+        if batch_size > self.max_batch_size:
+            yield torch.empty(batch_size, *self.image_shape, dtype=torch.float32)
+            return
+
+        buffer = (
+            self._free.pop()
+            if self._free
+            else torch.empty(
+                self.max_batch_size, *self.image_shape, dtype=torch.float32
+            )
+        )
+        yield buffer[:batch_size]
+
+        # Only a batch that completed gives its buffer back. After an error or a
+        # cancellation, worker threads may still be writing into it.
+        if len(self._free) < self.num_buffers:
+            self._free.append(buffer)
@@ -0,0 +1,128 @@
+import hashlib
+
+import faiss
+import numpy as np
+from config import settings
+from src.utils import LOGGER
+
+
+class FeatureReducer:
+    """
+    A trained PCA projection that reduces extracted features before they are
+    indexed or searched.
+
+    Attributes:
+        pca_matrix (faiss.VectorTransform): The trained projection.
+    """
+
+    def __init__(self, pca_matrix):
+        """
+        Initializes a FeatureReducer from a trained projection.
+
+        Args:
+        - pca_matrix (faiss.VectorTransform): The trained projection.
+        """
+        self.pca_matrix = pca_matrix
+
+    @classmethod
+    def fit(
+        cls,
+        features,
+        dimensions=settings.PCA_DIMENSIONS,
+        whiten=settings.PCA_WHITEN,
+        train_size=settings.PCA_TRAIN_SIZE,
+    ):
+        """
+        Fits a PCA projection on a random sample of the features.
+
+        Args:
+        - features (numpy.ndarray): The features to fit on. (N, D)
+        - dimensions (int): Number of output dimensions.
+        - whiten (bool): Whether to scale every component to unit variance.
+        - train_size (int): Number of sampled training vectors.
+
+        Returns:
+        - FeatureReducer: The fitted reducer.
+        """
+        rng = np.random.default_rng(0)
+        train_size = min(train_size, features.shape[0])
+        sample_ids = np.sort(rng.choice(features.shape[0], train_size, replace=False))
+
+        pca_matrix = faiss.PCAMatrix(
+            features.shape[1], dimensions, -0.5 if whiten else 0.0
+        )
+        pca_matrix.train(np.ascontiguousarray(features[sample_ids], dtype="float32"))
+
+        return cls(pca_matrix)
+
+    @classmethod
+    def load(cls, path=settings.PCA_PATH):
+        """
+        Loads a fitted reducer from disk.
+
+        Args:
+        - path (str): Path of the saved projection.
+
+        Returns:
+        - FeatureReducer: The loaded reducer.
+        """
+        pca_matrix = faiss.read_VectorTransform(path)
+        LOGGER.info(
+            f"Loaded PCA reduction {pca_matrix.d_in} -> {pca_matrix.d_out} dimensions"
+        )
+
+        return cls(pca_matrix)
+
+    def save(self, path=settings.PCA_PATH):
+        """
+        Saves the reducer to disk.
+
+        Args:
+        - path (str): Path of the saved projection.
+        """
+        faiss.write_VectorTransform(self.pca_matrix, path)
+
+    @property
+    def output_dim(self):
+        return self.pca_matrix.d_out
+
+    def signature(self):
+        """
+        Identifies the projection, so artifacts built from reduced features can
+        tell whether they still match it.
+
+        Returns:
+        - str: SHA-256 of the input and output dimensions and the projection.
+        """
+        digest = hashlib.sha256(
+            f"{self.pca_matrix.d_in}:{self.pca_matrix.d_out}".encode()
+        )
+        digest.update(faiss.vector_to_array(self.pca_matrix.A).tobytes())
+        digest.update(faiss.vector_to_array(self.pca_matrix.b).tobytes())
+
+        return digest.hexdigest()
+
+    def transform(self, features):
+        """
+        Projects features to the reduced space.
+
+        Args:
+        - features (numpy.ndarray): The features to reduce. (N, D)
+
+        Returns:
+        - numpy.ndarray: The reduced features. (N, output_dim)
+        """
+        return self.pca_matrix.apply(np.ascontiguousarray(features, dtype="float32"))
+
+
+def load_reducer():
+    """
+    Loads the configured reducer.
+
+    Returns:
+    - FeatureReducer: The reducer, or None if reduction is disabled.
+    """
+    if not settings.PCA_ENABLED:
+        return None
+
+    return FeatureReducer.load(settings.PCA_PATH)
@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import time
+
+import tritonclient.grpc.aio as grpcclient
+from config import settings
+from tritonclient.utils import InferenceServerException
+
+# Same limit as the default channel of tritonclient
+MAX_GRPC_MESSAGE_SIZE = 2**31 - 1
+
+# gRPC status codes of a broken connection or server, as reported by tritonclient.
+# Other errors, such as a malformed input, say nothing about the channel.
+TRANSPORT_STATUSES = (
+    "StatusCode.UNAVAILABLE",
+    "StatusCode.DEADLINE_EXCEEDED",
+    "StatusCode.CANCELLED",
+    "StatusCode.UNKNOWN",
+)
+
+
+def is_transport_error(error):
+    """
+    Returns whether an inference error means the channel itself failed.
+    """
+    if isinstance(error, InferenceServerException):
+        return error.status() in TRANSPORT_STATUSES
+
+    return isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+
+class TritonChannel:
+    """
+    One Triton gRPC client with its own HTTP/2 connection and request counters.
+
+    Attributes:
+        index (int): Position of the channel in the pool.
+        client (grpcclient.InferenceServerClient): The Triton client.
+        in_flight (int): Number of requests currently sent on the channel.
+        num_requests (int): Number of completed requests.
+        num_failures (int): Number of failed requests.
+        consecutive_failures (int): Number of transport errors since the last
+            successful request.
+        retry_at (float): Monotonic time after which a failing channel is tried
+            again.
+        total_latency (float): Sum of request latencies in seconds.
+    """
+
+    def __init__(
+        self,
+        index,
+        url,
+        max_in_flight,
+        channel_args,
+        retry_seconds=settings.TRITON_CHANNEL_RETRY_SECONDS,
+    ):
+        self.index = index
+        self.client = grpcclient.InferenceServerClient(
+            url=url, channel_args=channel_args
+        )
+        self.max_in_flight = max_in_flight
+        self.retry_seconds = retry_seconds
+
+        self._semaphore = None
+        self.in_flight = 0
+        self.num_requests = 0
+        self.num_failures = 0
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.total_latency = 0.0
+
+    @property
+    def healthy(self):
+        return self.consecutive_failures == 0
+
+    def available(self):
+        """
+        Returns whether the channel may be selected. Once its cooldown ends, a
+        failing channel takes a single probe request at a time, which either
+        marks it healthy again or starts another cooldown.
+        """
+        if self.healthy:
+            return True
+
+        return self.in_flight == 0 and time.monotonic() >= self.retry_at
+
+    async def infer(self, **kwargs):
+        """
+        Sends an inference request, waiting while the channel is at its in-flight
+        limit.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                start_time = time.perf_counter()
+                try:
+                    results = await self.client.infer(**kwargs)
+                except Exception as e:
+                    self.num_failures += 1
+                    if is_transport_error(e):
+                        self.consecutive_failures += 1
+                        self.retry_at = time.monotonic() + self.retry_seconds
+                    raise
+
+                self.num_requests += 1
+                self.consecutive_failures = 0
+                self.total_latency += time.perf_counter() - start_time
+
+                return results
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "channel": self.index,
+            "healthy": self.healthy,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "num_requests": self.num_requests,
+            "num_failures": self.num_failures,
+            "avg_latency_ms": self.total_latency * 1000 / self.num_requests
+            if self.num_requests
+            else 0.0,
+        }
+
+
+class TritonClientPool:
+    """
+    Spreads Triton inference requests over several gRPC channels, so a single
+    HTTP/2 connection does not limit throughput at high concurrency.
+
+    Each channel uses a local subchannel pool, which gives it its own TCP
+    connection to the same server, and keepalive pings to detect dead
+    connections. A channel with transport errors is skipped by least_in_flight
+    selection until its cooldown ends.
+
+    Attributes:
+        channels (list): The TritonChannel of every connection.
+        selection (str): "round_robin" or "least_in_flight".
+    """
+
+    def __init__(
+        self,
+        url=settings.TRITON_SERVER_URL,
+        num_channels=settings.TRITON_CHANNELS,
+        selection=settings.TRITON_CHANNEL_SELECTION,
+        max_in_flight=settings.TRITON_CHANNEL_MAX_IN_FLIGHT,
+        keepalive_time_ms=settings.TRITON_KEEPALIVE_TIME_MS,
+        keepalive_timeout_ms=settings.TRITON_KEEPALIVE_TIMEOUT_MS,
+        retry_seconds=settings.TRITON_CHANNEL_RETRY_SECONDS,
+    ):
+        """
+        Initializes the TritonClientPool.
+
+        Args:
+        - url (str): Triton gRPC url.
+        - num_channels (int): Number of connections.
+        - selection (str): "round_robin" or "least_in_flight".
+        - max_in_flight (int): Maximum number of requests in flight per channel.
+        - keepalive_time_ms (int): Interval of keepalive pings.
+        - keepalive_timeout_ms (int): Time to wait for a ping acknowledgement
+          before closing the connection.
+        - retry_seconds (float): Time a channel with transport errors is skipped
+          before it is tried again.
+        """
+        if selection not in ("round_robin", "least_in_flight"):
+            raise ValueError(f"Unsupported Triton channel selection: {selection}")
+
+        # Replaces the default channel arguments of tritonclient
+        channel_args = [
+            ("grpc.max_send_message_length", MAX_GRPC_MESSAGE_SIZE),
+            ("grpc.max_receive_message_length", MAX_GRPC_MESSAGE_SIZE),
+            ("grpc.keepalive_time_ms", keepalive_time_ms),
+            ("grpc.keepalive_timeout_ms", keepalive_timeout_ms),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+            ("grpc.use_local_subchannel_pool", 1),
+        ]
+
+        self.selection = selection
+        self.channels = [
+            TritonChannel(i, url, max_in_flight, channel_args, retry_seconds)
+            for i in range(max(1, num_channels))
+        ]
+        self._round_robin = itertools.cycle(self.channels)
+
+    def select(self):
+        """
+        Picks the channel for the next request.
+
+        Returns:
+        - TritonChannel: The selected channel.
+        """
+        if self.selection == "round_robin":
+            return next(self._round_robin)
+
+        # Prefer available channels, then the least loaded one
+        return min(
+            self.channels,
+            key=lambda channel: (not channel.available(), channel.in_flight),
+        )
+
+    async def infer(self, **kwargs):
+        """
+        Sends an inference request on the selected channel. Takes the arguments of
+        InferenceServerClient.infer.
+        """
+        return await self.select().infer(**kwargs)
+
+    async def register_system_shared_memory(self, *args, **kwargs):
+        # Regions are registered server-wide, any channel will do
+        return await self.channels[0].client.register_system_shared_memory(
+            *args, **kwargs
+        )
+
+    async def unregister_system_shared_memory(self, *args, **kwargs):
+        return await self.channels[0].client.unregister_system_shared_memory(
+            *args, **kwargs
+        )
+
+    def stats(self):
+        """
+        Returns the health, load and latency of every channel.
+
+        Returns:
+        - list: One dictionary per channel.
+        """
+        return [channel.stats() for channel in self.channels]
+
+    async def close(self):
+        """
+        Closes every channel.
+        """
+        for channel in self.channels:
+            await channel.client.close()
@@ -0,0 +1,203 @@
+import asyncio
+import contextlib
+import os
+
+import numpy as np
+import tritonclient.grpc.aio as grpcclient
+import tritonclient.utils.shared_memory as shm
+from config import settings
+from src.utils import LOGGER
+
+
+class SharedMemorySlot:
+    """
+    A pair of system shared-memory regions holding the input and output tensors of
+    one in-flight request.
+
+    Attributes:
+        input_name (str): Name of the input region registered with Triton.
+        output_name (str): Name of the output region registered with Triton.
+        input_handle: Handle of the input region.
+        output_handle: Handle of the output region.
+        input_byte_size (int): Size of the input region in bytes.
+        output_byte_size (int): Size of the output region in bytes.
+    """
+
+    def __init__(self, prefix, input_byte_size, output_byte_size):
+        self.input_name = f"{prefix}_input"
+        self.output_name = f"{prefix}_output"
+        self.input_byte_size = input_byte_size
+        self.output_byte_size = output_byte_size
+
+        self.input_handle = shm.create_shared_memory_region(
+            self.input_name, f"/{self.input_name}", input_byte_size
+        )
+        try:
+            self.output_handle = shm.create_shared_memory_region(
+                self.output_name, f"/{self.output_name}", output_byte_size
+            )
+        except Exception:
+            shm.destroy_shared_memory_region(self.input_handle)
+            raise
+
+    async def register(self, client):
+        await client.register_system_shared_memory(
+            self.input_name, f"/{self.input_name}", self.input_byte_size
+        )
+        await client.register_system_shared_memory(
+            self.output_name, f"/{self.output_name}", self.output_byte_size
+        )
+
+    async def unregister(self, client):
+        # Unregister both regions even if one of them was never registered
+        for name in (self.input_name, self.output_name):
+            with contextlib.suppress(Exception):
+                await client.unregister_system_shared_memory(name)
+
+    def destroy(self):
+        shm.destroy_shared_memory_region(self.input_handle)
+        shm.destroy_shared_memory_region(self.output_handle)
+
+
+class TritonSharedMemoryPool:
+    """
+    Passes Triton inference tensors through system shared memory instead of the
+    gRPC message, for a Triton server running on the same host.
+
+    Every concurrent request takes one slot of input and output regions, so the
+    number of slots bounds the number of requests in flight. The regions are
+    created and registered with Triton on first use. Triton must see the same
+    /dev/shm as this process, e.g. with ``ipc: host`` in docker-compose.
+
+    Attributes:
+        client (TritonClientPool | grpcclient.InferenceServerClient): The Triton
+            client.
+        num_slots (int): Number of input/output region pairs.
+        max_batch_size (int): Largest batch that fits in a slot.
+        output_dim (int): Number of features per image.
+    """
+
+    def __init__(
+        self,
+        client,
+        num_slots=settings.TRITON_SHM_SLOTS,
+        max_batch_size=settings.BATCH_MAX_SIZE,
+        input_shape=(3, 300, 300),
+        output_dim=settings.DIMENSIONS,
+    ):
+        """
+        Initializes the TritonSharedMemoryPool.
+
+        Args:
+        - client (TritonClientPool | grpcclient.InferenceServerClient): The
+          Triton client.
+        - num_slots (int): Number of input/output region pairs.
+        - max_batch_size (int): Largest batch that fits in a slot.
+        - input_shape (tuple): Shape of one preprocessed image.
+        - output_dim (int): Number of features per image.
+        """
+        self.client = client
+        self.num_slots = max(1, num_slots)
+        self.max_batch_size = max_batch_size
+        self.input_shape = input_shape
+        self.output_dim = output_dim
+
+        self._slots = []
+        self._free_slots = None
+        self._setup_lock = asyncio.Lock()
+
+    async def _ensure_registered(self):
+        """
+        Creates the regions and registers them with Triton.
+        """
+        async with self._setup_lock:
+            if self._free_slots is not None:
+                return
+
+            # Region names must be unique across the worker processes of a host
+            prefix = f"image_search_{os.getpid()}"
+            input_byte_size = self.max_batch_size * int(np.prod(self.input_shape)) * 4
+            output_byte_size = self.max_batch_size * self.output_dim * 4
+
+            free_slots = asyncio.Queue()
+            try:
+                for i in range(self.num_slots):
+                    slot = SharedMemorySlot(
+                        f"{prefix}_{i}", input_byte_size, output_byte_size
+                    )
+                    self._slots.append(slot)
+                    await slot.register(self.client)
+                    free_slots.put_nowait(slot)
+            except Exception:
+                # Release the slots set up so far, so the next request starts
+                # from clean region names instead of failing on the same ones
+                await self._release_slots()
+                raise
+
+            self._free_slots = free_slots
+            LOGGER.info(
+                f"Registered {self.num_slots} Triton shared-memory slots of "
+                f"{(input_byte_size + output_byte_size) / 2**20:.1f} MiB"
+            )
+
+    async def infer(self, image, model_name, inputs_name, outputs_name):
+        """
+        Perform Triton inference with the tensors passed through shared memory.
+
+        Args:
+        - image (torch.Tensor): Preprocessed image tensor. [N, 3, 300, 300]
+        - model_name (str): Name of the Triton model.
+        - inputs_name (str): Name of the input tensor.
+        - outputs_name (str): Name of the output tensor.
+
+        Returns:
+        - numpy.ndarray: Extracted features as a numpy array. (N, DIMENSIONS)
+        """
+        if self._free_slots is None:
+            await self._ensure_registered()
+
+        image = np.ascontiguousarray(image.numpy(), dtype=np.float32)
+        slot = await self._free_slots.get()
+
+        try:
+            shm.set_shared_memory_region(slot.input_handle, [image])
+
+            inputs = [grpcclient.InferInput(inputs_name, image.shape, datatype="FP32")]
+            inputs[0].set_shared_memory(slot.input_name, image.nbytes)
+
+            output_byte_size = image.shape[0] * self.output_dim * 4
+            outputs = [grpcclient.InferRequestedOutput(outputs_name)]
+            outputs[0].set_shared_memory(slot.output_name, output_byte_size)
+
+            results = await self.client.infer(
+                model_name=model_name, inputs=inputs, outputs=outputs
+            )
+
+            output = results.get_output(outputs_name)
+            feature = shm.get_contents_as_numpy(
+                slot.output_handle, np.float32, list(output.shape)
+            )
+
+            # The region is reused by the next request
+            return feature.copy()
+
+        finally:
+            self._free_slots.put_nowait(slot)
+
+    async def close(self):
+        """
+        Unregisters the regions from Triton and destroys them.
+        """
+        await self._release_slots()
+        self._free_slots = None
+
+    async def _release_slots(self):
+        """
+        Unregisters and destroys every slot created so far.
+        """
+        for slot in self._slots:
+            await slot.unregister(self.client)
+            with contextlib.suppress(Exception):
+                slot.destroy()
+
+        self._slots = []
@@ -1,10 +1,24 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
 import pandas as pd
 from config import settings
-from qdrant_client import QdrantClient, grpc
+from qdrant_client import QdrantClient, grpc, models
+from src.feature_extraction.reduction import load_reducer
 from src.utils import LOGGER, time_profiling
 from tqdm import tqdm
 
+# Payload fields used by search filters and their index types
+PAYLOAD_INDEXES = {
+    "sale_item_price": grpc.FieldType.FieldTypeInteger,
+    "sale_rate": grpc.FieldType.FieldTypeFloat,
+    "sales_number": grpc.FieldType.FieldTypeInteger,
+    "shop_path": grpc.FieldType.FieldTypeKeyword,
+}
+
 
 class QdrantIngest:
     """
@@ -13,15 +27,10 @@ class QdrantIngest:
     Attributes:
         client_grpc (QdrantClient): A client for interacting with Qdrant.
 
-        item_path (numpy.ndarray): Array of item URLs.
-        item_image (numpy.ndarray): Array of item images.
-        item_name (numpy.ndarray): Array of item names.
-        fixed_item_price (numpy.ndarray): Array of item prices.
-        sale_item_price (numpy.ndarray): Array of sale item prices.
-        sales_number (numpy.ndarray): Array of sales numbers.
-        shop_path (numpy.ndarray): Array of shop paths.
-        shop_name (numpy.ndarray): Array of shop names.
+        payloads (list): Payload dictionary of every item in the dataset.
         image_features (numpy.ndarray): Array of features to be ingested.
+        valid (numpy.ndarray): Which rows have features, the others are skipped.
+        reducer (FeatureReducer): PCA reduction applied before ingestion, or None.
     """
 
     def __init__(self):
@@ -31,35 +40,77 @@ class QdrantIngest:
         # Create a client to interact with Qdrant
         self.client_grpc = QdrantClient(url=settings.QDRANT_URL, prefer_grpc=True)
 
-        # Load the dataset
-        data = pd.read_csv(settings.DATA_PATH)
-
-        # Extract attributes from the dataset
-        self.item_path = data["item_path"]
-        self.item_image = data["item_image"]
-        self.item_name = data["item_name"]
-        self.fixed_item_price = data["fixed_item_price"]
-        self.sale_item_price = data["sale_item_price"]
-        self.sales_number = data["sales_number"]
-        self.shop_path = data["shop_path"]
-        self.shop_name = data["shop_name"]
+        # Load the dataset and build the payloads
+        self.payloads = self.build_payloads(pd.read_csv(settings.DATA_PATH))
 
         # Load array features
-        self.image_features = np.load(settings.FEATURES_PATH, allow_pickle=True)
+        with np.load(settings.FEATURES_PATH, allow_pickle=True) as features:
+            self.image_features = features["image_features"]
+
+            # Rows whose image could not be decoded hold zero vectors, their
+            # cosine is undefined so they are not uploaded
+            self.valid = (
+                features["valid"].astype(bool)
+                if "valid" in features
+                else np.ones(len(self.image_features), dtype=bool)
+            )
+
+        # Load the PCA reduction, if enabled
+        self.reducer = load_reducer()
+
+    @staticmethod
+    def build_payloads(data):
+        """
+        Builds the payload of every item column by column, without indexing the
+        dataset per element.
+
+        Args:
+            data (pd.DataFrame): The dataset, one row per item.
 
-    def create_collection(self):
+        Returns:
+            list: Payload dictionary of every item, in dataset order.
+        """
+        fixed_item_price = data["fixed_item_price"].fillna(0).to_numpy(dtype=np.int64)
+        sale_item_price = data["sale_item_price"].fillna(0).to_numpy(dtype=np.int64)
+
+        # Compute the discount rate of every item at once
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sale_rate = 1 - sale_item_price / fixed_item_price
+        sale_rate = np.where(np.isfinite(sale_rate), sale_rate, 0.0)
+
+        columns = {
+            "item_path": data["item_path"].fillna("").astype(str).tolist(),
+            "item_image": data["item_image"].fillna("").astype(str).tolist(),
+            "item_name": data["item_name"].fillna("").astype(str).tolist(),
+            "fixed_item_price": fixed_item_price.tolist(),
+            "sale_item_price": sale_item_price.tolist(),
+            "sale_rate": sale_rate.tolist(),
+            "sales_number": data["sales_number"].fillna(0).astype(np.int64).tolist(),
+            "shop_path": data["shop_path"].fillna("").astype(str).tolist(),
+            "shop_name": data["shop_name"].fillna("").astype(str).tolist(),
+        }
+
+        fields = list(columns)
+        return [dict(zip(fields, row)) for row in zip(*columns.values())]
+
+    def create_collection(self, collection_name=settings.QDRANT_COLLECTION, **profile):
         """
         Creates a collection in Qdrant.
+
+        Args:
+            collection_name (str): Name of the collection.
+            **profile: Overrides of the configured collection profile, see
+                collection_config.
         """
         # Create collection
         response = self.client_grpc.grpc_collections.Create(
             grpc.CreateCollection(
-                collection_name=settings.QDRANT_COLLECTION,
-                vectors_config=grpc.VectorsConfig(
-                    params=grpc.VectorParams(
-                        size=settings.DIMENSIONS,
-                        distance=grpc.Distance.Cosine,
-                    )
+                collection_name=collection_name,
+                **collection_config(
+                    size=self.reducer.output_dim
+                    if self.reducer is not None
+                    else settings.DIMENSIONS,
+                    **profile,
                 ),
                 timeout=10,
             )
@@ -67,6 +118,24 @@ class QdrantIngest:
 
         return response
 
+    def create_payload_indexes(self, collection_name=settings.QDRANT_COLLECTION):
+        """
+        Indexes the payload fields used by search filters, so filtered searches
+        are planned with the payload index instead of scanning payloads.
+
+        Args:
+            collection_name (str): Name of the collection.
+        """
+        for field_name, field_type in PAYLOAD_INDEXES.items():
+            self.client_grpc.grpc_points.CreateFieldIndex(
+                grpc.CreateFieldIndexCollection(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_type=field_type,
+                    wait=True,
+                )
+            )
+
     def check_collection(self):
         """
         Checks if the collection already exists in Qdrant.
@@ -76,46 +145,216 @@ class QdrantIngest:
         )
         return response
 
+    def load_checkpoint(self, num_points, batch_size):
+        """
+        Loads the batches completed by an interrupted ingestion of the same
+        collection, dataset size and batch size.
+
+        Args:
+            num_points (int): Number of points to ingest.
+            batch_size (int): Number of points per batch.
+
+        Returns:
+            set: Indices of the batches already uploaded.
+        """
+        if not os.path.exists(settings.QDRANT_CHECKPOINT_PATH):
+            return set()
+
+        with open(settings.QDRANT_CHECKPOINT_PATH) as f:
+            checkpoint = json.load(f)
+
+        if checkpoint.get("run") != self.checkpoint_run(num_points, batch_size):
+            LOGGER.info("Qdrant ingestion checkpoint does not match, start over.")
+            return set()
+
+        return set(checkpoint["completed_batches"])
+
+    def save_checkpoint(self, num_points, batch_size, completed_batches):
+        """
+        Saves the uploaded batches so that an interrupted ingestion can resume.
+
+        Args:
+            num_points (int): Number of points to ingest.
+            batch_size (int): Number of points per batch.
+            completed_batches (set): Indices of the batches already uploaded.
+        """
+        checkpoint = {
+            "run": self.checkpoint_run(num_points, batch_size),
+            "completed_batches": sorted(completed_batches),
+        }
+
+        tmp_path = f"{settings.QDRANT_CHECKPOINT_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, settings.QDRANT_CHECKPOINT_PATH)
+
+    def start_checkpoint(self, batch_size=settings.QDRANT_BATCH_SIZE):
+        """
+        Saves an empty checkpoint before a new collection is filled, so a run
+        interrupted before its first batch is resumed instead of leaving a
+        collection that looks complete.
+
+        Args:
+            batch_size (int): Number of points per batch.
+        """
+        self.save_checkpoint(self.image_features.shape[0], batch_size, set())
+
+    @staticmethod
+    def checkpoint_run(num_points, batch_size):
+        return {
+            "collection": settings.QDRANT_COLLECTION,
+            "num_points": num_points,
+            "batch_size": batch_size,
+        }
+
+    def has_checkpoint(self):
+        """
+        Checks if an interrupted ingestion left a checkpoint to resume from.
+        """
+        return os.path.exists(settings.QDRANT_CHECKPOINT_PATH)
+
+    def upload_batch(self, start_idx, end_idx):
+        """
+        Uploads one batch of points and waits until Qdrant has applied it.
+
+        Args:
+            start_idx (int): First point id of the batch.
+            end_idx (int): Point id after the last one of the batch.
+        """
+        # Point ids stay data.csv rows when rows without features are skipped
+        ids = start_idx + np.flatnonzero(self.valid[start_idx:end_idx])
+        if not len(ids):
+            return
+
+        vectors = self.image_features[ids]
+        if self.reducer is not None:
+            vectors = self.reducer.transform(vectors)
+
+        self.client_grpc.upsert(
+            collection_name=settings.QDRANT_COLLECTION,
+            points=models.Batch(
+                ids=ids.tolist(),
+                vectors=vectors.tolist(),
+                payloads=[self.payloads[i] for i in ids],
+            ),
+            wait=True,
+        )
+
     @time_profiling
-    def add_points(self, batch_size=1000):
+    def add_points(
+        self,
+        batch_size=settings.QDRANT_BATCH_SIZE,
+        num_workers=settings.QDRANT_UPLOAD_WORKERS,
+    ):
         """
-        Adds data points to the Qdrant collection.
+        Adds data points to the Qdrant collection, uploading several batches
+        concurrently and skipping batches uploaded by an interrupted run.
+
+        Args:
+            batch_size (int): Number of points per batch.
+            num_workers (int): Number of batches uploaded concurrently.
         """
-        num_features = self.image_features["image_features"].shape[0]
-        # num_features = 2000
+        num_features = self.image_features.shape[0]
         num_batches = (num_features + batch_size - 1) // batch_size
 
-        for i in tqdm(range(num_batches)):
-            # Split into batches
-            start_idx = i * batch_size
-            end_idx = min((i + 1) * batch_size, num_features)
-
-            ids = list(range(start_idx, end_idx))
-
-            payloads = [
-                {
-                    "item_path": self.item_path[idx],
-                    "item_image": self.item_image[idx],
-                    "item_name": self.item_name[idx],
-                    "fixed_item_price": int(self.fixed_item_price[idx]),
-                    "sale_item_price": int(self.sale_item_price[idx]),
-                    "sale_rate": float(
-                        1 - self.sale_item_price[idx] / self.fixed_item_price[idx]
-                    ),
-                    "sales_number": int(self.sales_number[idx]),
-                    "shop_path": self.shop_path[idx],
-                    "shop_name": self.shop_name[idx],
-                }
-                for idx in range(start_idx, end_idx)
-            ]
-
-            vectors = self.image_features["image_features"][start_idx:end_idx]
-
-            self.client_grpc.upload_collection(
-                collection_name=settings.QDRANT_COLLECTION,
-                vectors=vectors,
-                payload=payloads,
-                ids=ids,
+        completed_batches = self.load_checkpoint(num_features, batch_size)
+        pending_batches = [i for i in range(num_batches) if i not in completed_batches]
+        if completed_batches:
+            LOGGER.info(
+                f"Resume Qdrant ingestion, {len(completed_batches)}/{num_batches} "
+                "batches already uploaded."
             )
 
-        LOGGER.info("Done adding points to the collection!")
+        start_time = time.time()
+        num_uploaded = 0
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(
+                    self.upload_batch,
+                    i * batch_size,
+                    min((i + 1) * batch_size, num_features),
+                ): i
+                for i in pending_batches
+            }
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                if future.exception() is not None:
+                    # Stop on the first failure, the checkpoint keeps the finished
+                    # batches for the next run
+                    for pending in futures:
+                        pending.cancel()
+                    raise future.exception()
+
+                i = futures[future]
+                completed_batches.add(i)
+                num_uploaded += int(
+                    self.valid[i * batch_size : (i + 1) * batch_size].sum()
+                )
+                self.save_checkpoint(num_features, batch_size, completed_batches)
+
+        # The ingestion is complete, the next run starts over
+        if self.has_checkpoint():
+            os.remove(settings.QDRANT_CHECKPOINT_PATH)
+
+        elapsed = time.time() - start_time
+        LOGGER.info(
+            f"Done adding {num_uploaded} points to the collection at "
+            f"{num_uploaded / max(elapsed, 1e-9):.1f} points/sec!"
+        )
+
+
+def collection_config(
+    size,
+    hnsw_m=settings.QDRANT_HNSW_M,
+    hnsw_ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT,
+    indexing_threshold=settings.QDRANT_INDEXING_THRESHOLD,
+    segment_number=settings.QDRANT_SEGMENT_NUMBER,
+    on_disk=settings.QDRANT_ON_DISK,
+    quantization=settings.QDRANT_QUANTIZATION,
+    quantization_quantile=settings.QDRANT_QUANTIZATION_QUANTILE,
+    quantization_always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM,
+):
+    """
+    Builds the vector, HNSW, optimizer and quantization settings of a collection.
+
+    Args:
+        size (int): Dimensionality of the vectors.
+        hnsw_m (int): Number of edges per node of the HNSW graph.
+        hnsw_ef_construct (int): Number of neighbors considered while building.
+        indexing_threshold (int): Number of vectors per segment above which the
+            segment is indexed with HNSW.
+        segment_number (int): Number of segments, 0 lets Qdrant choose.
+        on_disk (bool): Whether to keep the original vectors on disk.
+        quantization (bool): Whether to add int8 scalar quantized vectors.
+        quantization_quantile (float): Quantile of values used to compute the
+            quantization range, excluding outliers.
+        quantization_always_ram (bool): Whether to keep the quantized vectors in
+            RAM even when the original vectors are on disk.
+
+    Returns:
+        dict: Keyword arguments of grpc.CreateCollection.
+    """
+    config = {
+        "vectors_config": grpc.VectorsConfig(
+            params=grpc.VectorParams(
+                size=size, distance=grpc.Distance.Cosine, on_disk=on_disk
+            )
+        ),
+        "hnsw_config": grpc.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct),
+        "optimizers_config": grpc.OptimizersConfigDiff(
+            indexing_threshold=indexing_threshold,
+            default_segment_number=segment_number or None,
+        ),
+    }
+
+    if quantization:
+        config["quantization_config"] = grpc.QuantizationConfig(
+            scalar=grpc.ScalarQuantization(
+                type=grpc.QuantizationType.Int8,
+                quantile=quantization_quantile,
+                always_ram=quantization_always_ram,
+            )
+        )
+
+    return config
@@ -3,6 +3,7 @@ import asyncio
 import numpy as np
 from config import settings
 from qdrant_client import QdrantClient, grpc
+from src.feature_extraction.reduction import load_reducer
 
 
 class QdrantSearch:
@@ -11,6 +12,7 @@ class QdrantSearch:
 
     Attributes:
         client_grpc (QdrantClient): A client for interacting with Qdrant.
+        reducer (FeatureReducer): PCA reduction applied to queries, or None.
     """
 
     def __init__(self):
@@ -20,30 +22,139 @@ class QdrantSearch:
         # Create a client to interact with Qdrant
         self.client_grpc = QdrantClient(url=settings.QDRANT_URL, prefer_grpc=True)
 
+        # Load the PCA reduction, if enabled
+        self.reducer = load_reducer()
+
     # @async_time_profiling
-    async def search(self, query_vector, top_k=settings.TOP_K):
+    async def search(self, query_vector, top_k=settings.TOP_K, filters=None):
         """
         Performs a similarity search in Qdrant using a query vector.
 
         Args:
             query_vector (numpy.ndarray): The query vector for similarity search.
             top_k (int): The number of top results to retrieve (default is settings.TOP_K).
+            filters (SearchFilters): Payload filters applied during search, or None.
 
         Returns:
             grpc.SearchPointsResponse: The response from Qdrant containing search results.
         """
+        if self.reducer is not None:
+            query_vector = self.reducer.transform(query_vector)
+
         response = await self.client_grpc.async_grpc_points.Search(
             grpc.SearchPoints(
                 collection_name=settings.QDRANT_COLLECTION,
                 vector=query_vector[0],
                 limit=top_k,
                 with_payload=grpc.WithPayloadSelector(enable=True),
+                params=search_params(),
+                filter=build_filter(filters),
+            )
+        )
+
+        return response
+
+    async def search_batch(self, query_vectors, top_k=settings.TOP_K, filters=None):
+        """
+        Performs a similarity search for several query vectors in one request.
+
+        Args:
+            query_vectors (numpy.ndarray): The query vectors for similarity search.
+            top_k (int): The number of top results to retrieve (default is settings.TOP_K).
+            filters (SearchFilters): Payload filters applied during search, or None.
+
+        Returns:
+            grpc.SearchBatchResponse: The response from Qdrant containing one result
+            list per query vector, in input order.
+        """
+        if self.reducer is not None:
+            query_vectors = self.reducer.transform(query_vectors)
+
+        response = await self.client_grpc.async_grpc_points.SearchBatch(
+            grpc.SearchBatchPoints(
+                collection_name=settings.QDRANT_COLLECTION,
+                search_points=[
+                    grpc.SearchPoints(
+                        collection_name=settings.QDRANT_COLLECTION,
+                        vector=query_vector,
+                        limit=top_k,
+                        with_payload=grpc.WithPayloadSelector(enable=True),
+                        params=search_params(),
+                        filter=build_filter(filters),
+                    )
+                    for query_vector in query_vectors
+                ],
             )
         )
 
         return response
 
 
+def build_filter(filters):
+    """
+    Converts search filters into a Qdrant payload filter.
+
+    Args:
+        filters (SearchFilters): The filters, or None.
+
+    Returns:
+        grpc.Filter: The payload filter, or None if no filter is set.
+    """
+    if filters is None or filters.is_empty():
+        return None
+
+    conditions = []
+
+    ranges = {
+        "sale_item_price": (filters.min_price, filters.max_price),
+        "sale_rate": (filters.min_sale_rate, filters.max_sale_rate),
+        "sales_number": (filters.min_sales_number, None),
+    }
+    for key, (gte, lte) in ranges.items():
+        if gte is None and lte is None:
+            continue
+        conditions.append(
+            grpc.Condition(
+                field=grpc.FieldCondition(key=key, range=grpc.Range(gte=gte, lte=lte))
+            )
+        )
+
+    if filters.shop_path is not None:
+        conditions.append(
+            grpc.Condition(
+                field=grpc.FieldCondition(
+                    key="shop_path", match=grpc.Match(keyword=filters.shop_path)
+                )
+            )
+        )
+
+    return grpc.Filter(must=conditions)
+
+
+def search_params(
+    hnsw_ef=settings.QDRANT_HNSW_EF,
+    rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+    exact=False,
+):
+    """
+    Builds the search-time parameters of a query.
+
+    Args:
+        hnsw_ef (int): Number of candidates explored by the HNSW search.
+        rescore (bool): Whether to rescore the candidates found with quantized
+            vectors using the original vectors.
+        exact (bool): Whether to skip the index and search exhaustively.
+
+    Returns:
+        grpc.SearchParams: The search parameters.
+    """
+    return grpc.SearchParams(
+        hnsw_ef=hnsw_ef,
+        exact=exact,
+        quantization=grpc.QuantizationSearchParams(rescore=rescore),
+    )
+
+
 if __name__ == "__main__":
     # Instantiate the QdrantSearch class
     qdrant_search = QdrantSearch()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -33,3 +35,17 @@ class Product(BaseModel):
             shop_path=point.payload["shop_path"].string_value,
             shop_name=point.payload["shop_name"].string_value,
         )
+
+
+class SearchFilters(BaseModel):
+    min_price: Optional[int] = Field(None, ge=0, description="Minimum sale price")
+    max_price: Optional[int] = Field(None, ge=0, description="Maximum sale price")
+    min_sale_rate: Optional[float] = Field(None, description="Minimum discount rate")
+    max_sale_rate: Optional[float] = Field(None, description="Maximum discount rate")
+    min_sales_number: Optional[int] = Field(
+        None, ge=0, description="Minimum number of sales"
+    )
+    shop_path: Optional[str] = Field(None, description="Only items of this shop")
+
+    def is_empty(self) -> bool:
+        return not self.model_dump(exclude_none=True)
@@ -1,15 +1,28 @@
+import atexit
 import base64
 import functools
+import io
+import json
 import logging
+import logging.handlers
+import math
+import os
+import queue
+import random
 import time
+import warnings
 from datetime import datetime
 
-import cv2
 import numpy as np
 import pyinstrument
 import pytz
+import torch
 from config import settings
-from torchvision import transforms
+from PIL import Image, UnidentifiedImageError
+from torchvision.io import ImageReadMode, decode_image
+
+# Uploaded bytes are only read by the decoder, so a read-only buffer is fine
+warnings.filterwarnings("ignore", message="The given buffer is not writable")
 
 
 def time_profiling(func):
@@ -65,38 +78,430 @@ def py_profiling(func):
 
 
 # @async_time_profiling
-async def save_image_file(file):
-    # Prepend the current datetime to the filename
-    file.filename = datetime.now().strftime("%Y%m%d-%H%M%S-") + file.filename
+async def read_image_file(file, background_tasks):
+    """
+    Reads an uploaded image into memory and, for a sample of requests, schedules
+    saving the raw upload to disk after the response is sent.
 
-    # Construct the full image path based on the settings
-    image_path = settings.IMAGEDIR + file.filename
+    Args:
+    - file (UploadFile): The uploaded image file.
+    - background_tasks (BackgroundTasks): Tasks run after the response is sent.
+
+    Returns:
+    - bytes: The raw contents of the uploaded file.
+    """
+    # Reject oversized uploads before reading them, when the size is known
+    check_image_size(num_bytes=getattr(file, "size", None))
 
     # Read the contents of the uploaded file asynchronously
     contents = await file.read()
 
-    # Write the uploaded contents to the specified image path
-    with open(image_path, "wb") as f:
-        f.write(contents)
+    if random.random() < settings.UPLOAD_SAMPLE_RATE:
+        background_tasks.add_task(archive_image_file, contents, file.filename)
+
+    return contents
+
+
+async def read_request_image(request):
+    """
+    Reads the raw body of a binary image upload as it streams in, rejecting it as
+    soon as it exceeds the byte limit.
+
+    When Content-Length is known, the chunks are copied straight into a buffer of
+    that size, which the decoders then read in place.
+
+    Args:
+    - request (Request): The incoming request.
+
+    Returns:
+    - bytearray | bytes: The request body.
+
+    Raises:
+    - ImageTooLargeError: If the body exceeds the byte limit.
+    - ValueError: If the body does not match its Content-Length.
+    """
+    content_length = request.headers.get("content-length", "")
+    if not content_length.isdigit():
+        chunks = []
+        num_bytes = 0
+        async for chunk in request.stream():
+            num_bytes += len(chunk)
+            check_image_size(num_bytes=num_bytes)
+            chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    num_bytes = int(content_length)
+    check_image_size(num_bytes=num_bytes)
+
+    body = bytearray(num_bytes)
+    view = memoryview(body)
+    position = 0
+    async for chunk in request.stream():
+        if position + len(chunk) > num_bytes:
+            raise ValueError("Request body is longer than its Content-Length.")
+        view[position : position + len(chunk)] = chunk
+        position += len(chunk)
+
+    if position != num_bytes:
+        raise ValueError("Request body is shorter than its Content-Length.")
+
+    return body
+
+
+def unpack_msgpack_image(body):
+    """
+    Extracts the encoded image of a msgpack body, either a bin object or a map
+    with the image under the "image" key.
+
+    msgpack returns bin fields as new bytes objects, so the image is copied once
+    out of the body.
+
+    Args:
+    - body (bytes-like): The msgpack request body.
+
+    Returns:
+    - bytes: The encoded image data.
+
+    Raises:
+    - ValueError: If the body is not valid msgpack or holds no image.
+    """
+    import msgpack
+
+    try:
+        payload = msgpack.unpackb(body)
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        # Malformed data, unhashable map keys and oversized lengths alike
+        raise ValueError(f"Invalid msgpack body: {type(e).__name__}") from e
+
+    if isinstance(payload, dict):
+        payload = payload.get("image")
+
+    if not isinstance(payload, bytes) or not payload:
+        raise ValueError(
+            "msgpack body must be a bin object or a map with an image bin."
+        )
+
+    return payload
+
+
+class BufferReader(io.RawIOBase):
+    """
+    A read-only file over a bytes-like object that reads it in place, where
+    io.BytesIO copies anything but bytes.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        # Decoders may seek past the end, where reads return nothing
+        size = max(0, min(len(b), len(self.buffer) - self.position))
+        b[:size] = self.buffer[self.position : self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+def archive_image_file(contents, filename):
+    """
+    Saves a raw upload to the upload directory and prunes the oldest files beyond
+    the retention limit.
+
+    Args:
+    - contents (bytes): The raw contents of the uploaded file.
+    - filename (str): The original name of the uploaded file.
+    """
+    # Prepend the current datetime to the filename
+    filename = datetime.now().strftime("%Y%m%d-%H%M%S-") + os.path.basename(
+        filename or "upload"
+    )
+
+    # Construct the full image path based on the settings
+    image_path = os.path.join(settings.IMAGEDIR, filename)
+
+    try:
+        # Write the uploaded contents to the specified image path
+        with open(image_path, "wb") as f:
+            f.write(contents)
+
+        # Keep only the most recent uploads
+        entries = [
+            entry
+            for entry in os.scandir(settings.IMAGEDIR)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        if len(entries) > settings.UPLOAD_RETENTION:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[: len(entries) - settings.UPLOAD_RETENTION]:
+                os.remove(entry.path)
+
+    except OSError as e:
+        LOGGER.error(f"Could not archive uploaded image {filename}: {e}")
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an uploaded image exceeds the configured byte or pixel limit."""
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded file is not an image format that can be decoded."""
+
+
+def check_image_size(num_bytes=None, num_pixels=None):
+    """
+    Rejects images over the configured upload limits.
+
+    Args:
+    - num_bytes (int, optional): Size of the encoded image in bytes.
+    - num_pixels (int, optional): Number of pixels of the decoded image.
+
+    Raises:
+    - ImageTooLargeError: If a limit is exceeded.
+    """
+    if num_bytes is not None and num_bytes > settings.UPLOAD_MAX_BYTES:
+        raise ImageTooLargeError(
+            f"Image of {num_bytes} bytes exceeds the limit of "
+            f"{settings.UPLOAD_MAX_BYTES} bytes."
+        )
+    if num_pixels is not None and num_pixels > settings.UPLOAD_MAX_PIXELS:
+        raise ImageTooLargeError(
+            f"Image of {num_pixels} pixels exceeds the limit of "
+            f"{settings.UPLOAD_MAX_PIXELS} pixels."
+        )
+
+
+def open_image_header(contents):
+    """
+    Opens an encoded image without decoding it and checks it against the upload
+    limits, so oversized images are rejected before any decoder runs on them.
+
+    Args:
+    - contents (bytes-like): The encoded image data, read in place.
+
+    Returns:
+    - PIL.Image.Image: The image, whose pixels are not decoded yet.
+
+    Raises:
+    - ImageTooLargeError: If the image exceeds the upload limits.
+    - InvalidImageError: If the data is not a supported image.
+    """
+    check_image_size(num_bytes=len(contents))
+
+    # Only the header is read here
+    try:
+        image = Image.open(
+            io.BytesIO(contents)
+            if isinstance(contents, bytes)
+            else BufferReader(contents)
+        )
+    except Image.DecompressionBombError as e:
+        # PIL refuses images far over its own pixel limit before ours applies
+        raise ImageTooLargeError(str(e)) from e
+    except UnidentifiedImageError as e:
+        raise InvalidImageError("Uploaded file is not a supported image.") from e
+
+    width, height = image.size
+    check_image_size(num_pixels=width * height)
 
-    return image_path
+    return image
 
 
-def decode_img(img: str) -> np.ndarray:
-    image_array = np.frombuffer(base64.urlsafe_b64decode(img), dtype=np.uint8)
-    # Decode the image using OpenCV
-    image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+def decode_image_bytes(contents, min_size=320) -> torch.Tensor:
+    """
+    Decodes an encoded image (JPEG, PNG) from memory.
+
+    JPEG images are decoded at the strongest DCT downscale (1/2, 1/4 or 1/8) that
+    keeps the shorter side at least ``min_size``, so large photos are not decoded
+    at full resolution only to be resized down. The upload limits are checked on
+    the header, before decoding.
+
+    Args:
+    - contents (bytes-like): The encoded image data.
+    - min_size (int): Shorter side the decoded image must keep, the resize size
+      of the inference transforms.
+
+    Returns:
+    - torch.Tensor: RGB image tensor of dtype uint8. [3, H, W]
 
-    # Convert BGR image to RGB image
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    Raises:
+    - ImageTooLargeError: If the image exceeds the upload limits.
+    - InvalidImageError: If the data is not a supported image.
+    """
+    image = open_image_header(contents)
+    width, height = image.size
 
-    # Define a transform to convert
-    # the image to torch tensor
-    transform = transforms.Compose([transforms.ToTensor()])
+    # Below twice min_size no DCT scale applies, decode at full resolution
+    scale = min_size / min(width, height)
+    if image.format != "JPEG" or scale > 0.5:
+        data = torch.frombuffer(contents, dtype=torch.uint8)
+        return decode_image(data, mode=ImageReadMode.RGB)
 
-    # Convert the image to Torch tensor
-    tensor = transform(image)
-    return tensor
+    image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+    image = np.array(image.convert("RGB"))
+
+    return torch.from_numpy(image).permute(2, 0, 1)
+
+
+def decode_img(img: str, min_size=320) -> torch.Tensor:
+    """
+    Decodes a URL-safe base64-encoded image.
+
+    Args:
+    - img (str): Base64-encoded image data.
+    - min_size (int): Shorter side the decoded image must keep.
+
+    Returns:
+    - torch.Tensor: RGB image tensor of dtype uint8. [3, H, W]
+    """
+    return decode_image_bytes(base64.urlsafe_b64decode(img), min_size=min_size)
+
+
+class TimezoneFormatter(logging.Formatter):
+    """
+    Formats record times in the configured timezone.
+
+    The UTC offset is looked up once per hour of log time instead of converting
+    every record with pytz.
+    """
+
+    def __init__(self, fmt=None, datefmt=None, timezone=settings.LOG_TIMEZONE):
+        super().__init__(fmt, datefmt=datefmt)
+        self.timezone = pytz.timezone(timezone)
+        self.offset_hour = None
+        self.offset = 0.0
+
+    def converter(self, timestamp):
+        hour = int(timestamp // 3600)
+        if hour != self.offset_hour:
+            self.offset = (
+                datetime.fromtimestamp(timestamp, self.timezone)
+                .utcoffset()
+                .total_seconds()
+            )
+            self.offset_hour = hour
+
+        return time.gmtime(timestamp + self.offset)
+
+
+class JsonFormatter(TimezoneFormatter):
+    """
+    Formats records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the INFO and DEBUG records of high-volume modules.
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+
+        sample_rate = self.sample_rates.get(record.module)
+
+        return sample_rate is None or random.random() < sample_rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them, and drops them
+    instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue stays in-process, so formatting is left to the listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        """
+        Returns the queue counters.
+
+        Returns:
+        - dict: Queue depth and capacity, and number of dropped records.
+        """
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.dropped,
+        }
+
+
+class DropReportingQueueListener(logging.handlers.QueueListener):
+    """
+    Writes the queued records and, from the listener thread, warns whenever the
+    queue handler has dropped records since the last warning.
+    """
+
+    def __init__(self, queue_handler, *handlers):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.reported = 0
+
+    def handle(self, record):
+        super().handle(record)
+
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported:
+            super().handle(
+                logging.makeLogRecord(
+                    {
+                        "name": record.name,
+                        "levelno": logging.WARNING,
+                        "levelname": logging.getLevelName(logging.WARNING),
+                        "msg": f"Dropped {dropped - self.reported} log records, "
+                        f"the log queue is full ({dropped} in total).",
+                    }
+                )
+            )
+            self.reported = dropped
 
 
 def initial_logger():
@@ -106,39 +511,59 @@ def initial_logger():
     # Set the logging level
     logger.setLevel(logging.DEBUG)
 
-    # Set the timezone to Vietnam
-    vietnam_timezone = pytz.timezone("Asia/Ho_Chi_Minh")
-
-    # Configure logging with the Vietnam timezone
-    logging.Formatter.converter = (
-        lambda *args: pytz.utc.localize(datetime.utcnow())
-        .astimezone(vietnam_timezone)
-        .timetuple()
-    )
-
     # Define the log format
     console_log_format = "%(asctime)s - %(levelname)s - %(message)s"
     file_log_format = (
         "%(asctime)s - %(levelname)s - %(message)s - (%(filename)s:%(lineno)d)"
     )
 
+    # Format times in the Vietnam timezone, optionally as JSON
+    if settings.LOG_JSON:
+        console_formatter = file_formatter = JsonFormatter(datefmt=settings.DATE_FMT)
+    else:
+        console_formatter = TimezoneFormatter(
+            console_log_format, datefmt=settings.DATE_FMT
+        )
+        file_formatter = TimezoneFormatter(file_log_format, datefmt=settings.DATE_FMT)
+
     # Create a console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
-    console_handler.setFormatter(
-        logging.Formatter(console_log_format, datefmt=settings.DATE_FMT)
-    )
-    logger.addHandler(console_handler)
+    console_handler.setFormatter(console_formatter)
 
     # Create a file handler
     file_handler = logging.FileHandler(filename=settings.LOG_DIR, encoding="utf-8")
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(
-        logging.Formatter(file_log_format, datefmt=settings.DATE_FMT)
-    )
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(file_formatter)
+
+    # The request path only enqueues records, a listener thread formats and
+    # writes them
+    queue_handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    if settings.LOG_SAMPLE_RATES:
+        queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    logger.addHandler(queue_handler)
+
+    listener = DropReportingQueueListener(queue_handler, console_handler, file_handler)
+    listener.start()
+
+    # Flush the queued records on exit
+    atexit.register(listener.stop)
 
     return logger
 
 
+def logging_stats():
+    """
+    Returns the counters of the log queue, e.g. to notice dropped records.
+
+    Returns:
+    - dict: Queue depth and capacity, and number of dropped records.
+    """
+    for handler in LOGGER.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler.stats()
+
+    return {}
+
+
 LOGGER = initial_logger()
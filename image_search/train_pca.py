@@ -0,0 +1,24 @@
+import numpy as np
+from config import settings
+from src.feature_extraction.reduction import FeatureReducer
+from src.utils import LOGGER
+
+
+def main():
+    """
+    Main function to fit the PCA reduction on the catalog features.
+    """
+    features = np.load(settings.FEATURES_PATH, allow_pickle=True)["image_features"]
+
+    LOGGER.info(
+        f"Fit PCA {features.shape[1]} -> {settings.PCA_DIMENSIONS} dimensions "
+        f"(whiten={settings.PCA_WHITEN})!"
+    )
+    reducer = FeatureReducer.fit(features)
+    reducer.save(settings.PCA_PATH)
+
+    LOGGER.info(f"PCA reduction saved to {settings.PCA_PATH}")
+
+
+if __name__ == "__main__":
+    main()
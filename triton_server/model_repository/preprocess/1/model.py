@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+import triton_python_backend_utils as pb_utils
+from PIL import Image
+
+# EfficientNet-B3 inference transforms, as in EfficientNet_B3_Weights.IMAGENET1K_V1
+RESIZE_SIZE = 320
+CROP_SIZE = 300
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+
+
+def preprocess(contents):
+    """
+    Decodes an encoded image (JPEG, PNG) and applies the inference transforms.
+
+    Args:
+    - contents (bytes): The encoded image data.
+
+    Returns:
+    - numpy.ndarray: Preprocessed image. (3, 300, 300)
+    """
+    image = Image.open(io.BytesIO(contents)).convert("RGB")
+
+    # Resize the shorter side, keeping the aspect ratio
+    width, height = image.size
+    if width <= height:
+        size = (RESIZE_SIZE, int(RESIZE_SIZE * height / width))
+    else:
+        size = (int(RESIZE_SIZE * width / height), RESIZE_SIZE)
+    image = image.resize(size, Image.BICUBIC)
+
+    # Center crop
+    width, height = image.size
+    left = int(round((width - CROP_SIZE) / 2.0))
+    top = int(round((height - CROP_SIZE) / 2.0))
+    image = image.crop((left, top, left + CROP_SIZE, top + CROP_SIZE))
+
+    # HWC uint8 -> normalized CHW float32
+    array = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+
+    return (array - MEAN) / STD
+
+
+class TritonPythonModel:
+    """
+    Decodes raw image bytes and preprocesses them for efficientnet_b3_trt, so
+    clients send compressed images instead of float32 tensors.
+    """
+
+    def execute(self, requests):
+        responses = []
+
+        for request in requests:
+            images = pb_utils.get_input_tensor_by_name(request, "image").as_numpy()
+
+            try:
+                batch = np.stack([preprocess(image[0]) for image in images])
+            except Exception as e:
+                responses.append(
+                    pb_utils.InferenceResponse(
+                        error=pb_utils.TritonError(f"Could not decode image: {e}")
+                    )
+                )
+                continue
+
+            output = pb_utils.Tensor("preprocessed", batch.astype(np.float32))
+            responses.append(pb_utils.InferenceResponse(output_tensors=[output]))
+
+        return responses